@@ -1,69 +1,431 @@
+import asyncio
 import curses
+import os
+import signal
+import sys
+import time
+from . import screen
 from .ui_manager import UIManager
 from .toolbar_manager import ToolbarManager
 from .popup_manager import PopupManager
+from .constraint_layout import ConstraintLayout, without_offsets
+from .element_store import ElementStore, ROW
+from .layout_format import COMMON_KEYS
+from .element_search import ElementSearch
+from .edge_index import EdgeIndex
+from .renderer import Renderer, intersection, intersects
+from .selection import Selection
+from .layout_compiler import export_layout
+from .layout_lint import describe, lint, summary
+from .layout_journal import LayoutJournal
+from .layout_watcher import LayoutWatcher
+from .history import History
+from .macro import Macro, MacroPlayer
+from .profiler import FrameProfiler
+from .spatial_index import SpatialIndex
 from .ui_element import PopupButton, Checkbox, TextInput, UIElement  # Import Checkbox and other UI elements
 
 class Application:
-    def __init__(self, stdscr):
+    FRAME_RATE = 60  # Maximum screen updates per second.
+    MACRO_FILE = "macro.vcm"
+    MACRO_SPEED = 1.0  # Play Once timing: 1.0 real time, 2.0 twice as fast, 0 no waits.
+    PLAY_MANY_COUNT = 100  # Iterations run by Play Many.
+    HEADLESS_DRAW_INTERVAL = 0.25  # Seconds between frames during Play Many; None skips drawing.
+    PROFILE_FILE = "profile.jsonl"  # Frame timings are appended here on exit when profiling.
+    EXPORT_FILE = "layout_view.py"  # File > Export compiles the layout into this module.
+    AUTOSAVE_INTERVAL = 30  # Seconds between background syncs of the journal.
+    ESCAPE_DELAY = 25  # Milliseconds curses waits after Escape for the rest of a key sequence.
+    # Shift-arrow keys scroll the canvas by (rows, columns).
+    SCROLL_KEYS = {curses.KEY_SR: (-1, 0), curses.KEY_SF: (1, 0),
+                   curses.KEY_SLEFT: (0, -4), curses.KEY_SRIGHT: (0, 4)}
+    WHEEL_STEP = 3  # Rows (or, with Shift, columns) per mouse wheel notch.
+    # Wheel notches; curses only has BUTTON5 from Python 3.10 with mouse version 2.
+    WHEEL_UP = curses.BUTTON4_PRESSED
+    WHEEL_DOWN = getattr(curses, "BUTTON5_PRESSED", 0)
+    # Arrow keys move the selected elements by (rows, columns).
+    MOVE_KEYS = {curses.KEY_UP: (-1, 0), curses.KEY_DOWN: (1, 0),
+                 curses.KEY_LEFT: (0, -1), curses.KEY_RIGHT: (0, 1)}
+    MIN_WIDTH = 5  # Narrowest an element can be resized to.
+    SNAP_DISTANCE = 2  # Cells within which a dragged element snaps to another one's edge.
+    GRID = None  # (rows, columns) a drag snaps to away from other edges, e.g. (1, 4); None for no grid.
+    LINT_SIZE = None  # (lines, columns) of the terminal layouts are checked for; None for this one.
+    LINT_SHOWN = 15  # Problems listed in the Option-L popup.
+
+    def __init__(self, stdscr, frame_rate=FRAME_RATE, profile=False):
         self.stdscr = stdscr
-        self.elements = UIManager.load_layout()
-        self.selected_element = None
+        self.frame_rate = frame_rate
+        self.profiler = FrameProfiler(enabled=profile)
+        self.index = SpatialIndex(order=ROW)  # drawn in store order
+        self.renderer = Renderer(stdscr, self.index, self.profiler)
+        # Notified of every element that is added, removed or changed on the canvas.
+        self.observers = [self.index, self.renderer]
+        self.elements = ElementStore()
+        self.elements.observers = self.observers
+        self.element_search = ElementSearch(self.elements, self.index.sort)
+        # Selected elements; see the selected_element property for the primary one.
+        self.selection = Selection()
+        self.observers.extend([self.element_search, self.selection])
+        for element in UIManager.load_layout():
+            self.add_element(element)
+        # Attached after loading so the journal and history only see new
+        # edits, and the edge index is sorted once rather than per element.
+        self.edges = EdgeIndex(self.elements)
+        self.journal = LayoutJournal(elements=self.elements)
+        self.history = History(self.elements)
+        self.observers.extend([self.edges, self.journal, self.history])
+        # Places the elements with constraints for the current terminal size.
+        self.layout = ConstraintLayout(self.elements, ToolbarManager.canvas_rect(*stdscr.getmaxyx()),
+                                       self.MIN_WIDTH)
+        self.observers.append(self.layout)
+        self.resized = False  # SIGWINCH arrived since the last batch of events
+        self.gesture_open = False
+        self.clipboard = None
+        self.macro = Macro()
+        self.recording = False
+        self.macro_mark = 0  # macro length before the Macros menu was opened
+        self.player = None
+        self.playing = False
+        self.left_toolbar = ToolbarManager.left_toolbar_items()
+        self.left_toolbar_index = SpatialIndex(self.left_toolbar)
+        self.band = None         # (y, x, y, x) canvas corners of a rubber band being dragged
+        self.band_adds = False   # whether the band adds to the selection (Shift held)
+        self.move_anchor = None  # canvas cell the selection is being dragged from
+        self.move_rect = None    # bounds of the dragged selection when the drag started
+        self.move_offset = (0, 0)  # (rows, columns) it has been moved by since
+        self.snapping = True     # drags snap to element edges and the grid
+        self.guides = []         # ("row", y) and ("column", x) alignment guides of a drag
         self.file_menu_open = False
         self.elements_menu_open = False
+        self.elements_menu_query = ""   # type-to-filter text of the Elements menu
+        self.elements_menu_scroll = 0   # first match shown
+        self.elements_menu_cursor = 0   # highlighted match, chosen with Enter
         self.macros_menu_open = False
         self.edit_menu_open = False
         self.log_message = ""
+        # Popup or property editor that gets every input event while it is
+        # open (see popup_manager); None when the canvas has the input.
+        self.modal = None
+        # Coroutine functions run as background tasks alongside the main loop.
+        # A task that changes what is shown sets `wakeup` to get a new frame.
+        self.background = [self.autosave, self.watch_layout]
+        self.wakeup = None  # asyncio.Event, created by main_loop()
         self.crosshair_x, self.crosshair_y = -1, -1
+        # Canvas position shown at the top-left of the canvas area, relative
+        # to where it is when nothing is scrolled. Canvas coordinates equal
+        # screen coordinates at scroll (0, 0).
+        self.scroll_y, self.scroll_x = 0, 0
+        self.relayout()
+
+    @property
+    def selected_element(self):
+        # The primary selected element, shown in the properties panel.
+        return self.selection.primary
+
+    @selected_element.setter
+    def selected_element(self, element):
+        self.selection.set([element] if element else [])
+
+    def select(self, element):
+        # Make an element the primary selection. Clicking an element outside
+        # the selection selects only that element; clicking a selected one
+        # keeps the others so they can be moved or resized together.
+        if element in self.selection:
+            self.selection.add(element)
+        else:
+            self.selection.set([element])
 
     def initialize_curses(self):
-        curses.start_color()
-        curses.use_default_colors()
-        curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
-        curses.init_pair(2, curses.COLOR_WHITE, curses.COLOR_BLUE)
-        curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_CYAN)
-        self.stdscr.bkgd(' ', curses.color_pair(1))
-        curses.curs_set(0)
+        screen.start_color()
+        screen.use_default_colors()
+        screen.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
+        screen.init_pair(2, curses.COLOR_WHITE, curses.COLOR_BLUE)
+        screen.init_pair(3, curses.COLOR_BLACK, curses.COLOR_CYAN)
+        self.stdscr.bkgd(' ', screen.color_pair(1))
+        screen.curs_set(0)
         self.stdscr.nodelay(0)
         self.stdscr.keypad(1)
-        curses.mousemask(curses.ALL_MOUSE_EVENTS | curses.REPORT_MOUSE_POSITION)
+        screen.mousemask(curses.ALL_MOUSE_EVENTS | curses.REPORT_MOUSE_POSITION)
+        # Escape closes popups and menus; don't wait a second to tell it
+        # apart from the start of an escape sequence.
+        screen.set_escdelay(self.ESCAPE_DELAY)
 
-    def draw_ui(self):
+    def add_element(self, element):
+        self.elements.append(element)
+
+    def start_gesture(self):
+        # Everything until the mouse button is released is one undo step.
+        if not self.gesture_open:
+            self.history.begin()
+            self.gesture_open = True
+
+    def end_gesture(self):
+        if self.gesture_open:
+            self.history.end()
+            self.gesture_open = False
+
+    def relayout(self):
+        # Place the elements whose constraints depend on something that
+        # changed. The positions follow from the constraints, so they are not
+        # undo steps of their own.
+        if self.layout.pending():
+            with self.history.untracked():
+                self.layout.solve()
+            if self.layout.cycles:
+                self.log_message += f" - Constraint cycle at element {self.layout.cycles[0].id}"
+
+    def resize(self):
+        # The terminal changed size: lay out what is pinned to the canvas edges.
         max_y, max_x = self.stdscr.getmaxyx()
-        self.stdscr.clear()
-        ToolbarManager.draw_top_toolbar(
-            self.stdscr, self.file_menu_open, self.elements_menu_open, self.elements, self.macros_menu_open, self.edit_menu_open
-        )
-        left_toolbar = ToolbarManager.draw_left_toolbar(self.stdscr)
-        ToolbarManager.draw_right_toolbar(self.stdscr, self.selected_element, max_x)
-        for element in self.elements:
-            element.draw(self.stdscr)
-        if 0 <= self.crosshair_y < max_y and 0 <= self.crosshair_x < max_x:
+        self.layout.set_frame(ToolbarManager.canvas_rect(max_y, max_x))
+        self.log_message = f"Terminal resized to {max_y}x{max_x}"
+
+    def scroll_by(self, dy, dx):
+        # Move the viewport, keeping some part of the layout (or the unscrolled
+        # origin) inside it.
+        top, left, height, width = ToolbarManager.canvas_rect(*self.stdscr.getmaxyx())
+        extent = self.elements.extent() or (top, left, top, left)
+        min_y, max_y = min(0, extent[0] - top), max(0, extent[2] - top - height)
+        min_x, max_x = min(0, extent[1] - left), max(0, extent[3] - left - width)
+        self.scroll_y = max(min_y, min(self.scroll_y + dy, max_y))
+        self.scroll_x = max(min_x, min(self.scroll_x + dx, max_x))
+        self.log_message += f" - Viewport at ({self.scroll_x},{self.scroll_y})"
+
+    def reveal(self, element):
+        # Scroll so that the element is inside the viewport, if it isn't.
+        top, left, height, width = ToolbarManager.canvas_rect(*self.stdscr.getmaxyx())
+        y, x, element_height, element_width = element.bounds()
+        if not (top + self.scroll_y <= y and y + element_height <= top + self.scroll_y + height):
+            self.scroll_y = y - top - max(height - element_height, 0) // 2
+        if not (left + self.scroll_x <= x and x + element_width <= left + self.scroll_x + width):
+            self.scroll_x = x - left - max(width - element_width, 0) // 2
+
+    def elements_menu_matches(self):
+        return self.element_search.search(self.elements_menu_query)
+
+    def move_elements_menu_cursor(self, cursor):
+        # Highlight another match, scrolling the list to keep it visible.
+        matches = self.elements_menu_matches()
+        rows = ToolbarManager.elements_menu_rows(len(matches), self.stdscr.getmaxyx()[0])
+        self.elements_menu_cursor = max(0, min(cursor, len(matches) - 1))
+        if self.elements_menu_cursor < self.elements_menu_scroll:
+            self.elements_menu_scroll = self.elements_menu_cursor
+        elif rows and self.elements_menu_cursor >= self.elements_menu_scroll + rows:
+            self.elements_menu_scroll = self.elements_menu_cursor - rows + 1
+
+    def select_from_elements_menu(self, index):
+        matches = self.elements_menu_matches()
+        if not 0 <= index < len(matches):
+            return False
+        self.selected_element = matches[index]
+        self.reveal(self.selected_element)
+        self.log_message += f" - Selected element {self.selected_element.id} from Elements menu"
+        self.elements_menu_open = False
+        return True
+
+    def handle_elements_menu_key(self, key):
+        # Keys typed while the Elements menu is open edit its search query and
+        # move through the matches. Returns False for keys it doesn't use.
+        page = max(ToolbarManager.elements_menu_rows(len(self.elements_menu_matches()),
+                                                     self.stdscr.getmaxyx()[0]), 1)
+        if 32 <= key < 127:
+            self.elements_menu_query += chr(key)
+        elif key in (curses.KEY_BACKSPACE, 127):
+            self.elements_menu_query = self.elements_menu_query[:-1]
+        elif key == curses.KEY_UP:
+            self.move_elements_menu_cursor(self.elements_menu_cursor - 1)
+            return True
+        elif key == curses.KEY_DOWN:
+            self.move_elements_menu_cursor(self.elements_menu_cursor + 1)
+            return True
+        elif key in (curses.KEY_PPAGE, curses.KEY_NPAGE):
+            self.move_elements_menu_cursor(self.elements_menu_cursor + (page if key == curses.KEY_NPAGE else -page))
+            return True
+        elif key in (10, 13, curses.KEY_ENTER):
+            if not self.select_from_elements_menu(self.elements_menu_cursor):
+                self.log_message += " - No matching element"
+            return True
+        elif key == 27:  # Escape
+            self.elements_menu_open = False
+            return True
+        else:
+            return False
+        self.elements_menu_scroll = self.elements_menu_cursor = 0
+        self.log_message += f" - Elements matching '{self.elements_menu_query}'"
+        return True
+
+    def handle_file_option(self, option):
+        if option == "Save":
+            self.journal.save()
+            self.log_message += " - Saved via File menu; " + summary(self.lint_layout())
+        elif option == "Export":
             try:
-                self.stdscr.addch(self.crosshair_y, self.crosshair_x, ord('+'), curses.color_pair(3))
-            except curses.error:
-                pass
+                lines = export_layout([el.to_dict() for el in self.elements], self.EXPORT_FILE)
+                self.log_message += f" - Exported {len(self.elements)} elements to {self.EXPORT_FILE} ({lines} lines)"
+            except OSError as e:
+                self.log_message += f" - Could not export: {e}"
+        else:
+            self.log_message += f" - '{option}' is not available yet"
+
+    def lint_layout(self):
+        # Problems of the layout on a LINT_SIZE terminal (see layout_lint).
+        return lint(self.elements, self.LINT_SIZE or self.stdscr.getmaxyx())
+
+    def handle_edit_option(self, option):
+        if option == "Undo":
+            done = self.history.undo()
+        elif option == "Redo":
+            done = self.history.redo()
+        elif option == "Cut":
+            done = len(self.selection) > 0
+            if done:
+                self.clipboard = [el.to_dict() for el in self.selection]
+                self.elements.remove_many(list(self.selection))
+        else:  # Paste
+            done = self.clipboard is not None
+            if done:
+                pasted = []
+                for item in self.clipboard:
+                    data = dict(item)
+                    del data["id"]  # The pasted copy gets an id of its own.
+                    data["y"] += 1
+                    data["x"] += 1
+                    if data.get("constraints"):
+                        data["constraints"] = without_offsets(data["constraints"])  # Stay where pasted.
+                    pasted.append(UIManager.element_from_dict(data))
+                for element in pasted:
+                    self.add_element(element)
+                self.selection.set(pasted)
+                self.clipboard = [el.to_dict() for el in pasted]
+        return done
+
+    def handle_macro_option(self, option):
+        if option == "Start/Stop":
+            self.recording = not self.recording
+            if self.recording:
+                self.macro.start()
+                self.log_message += " - Recording macro"
+            else:
+                self.macro.truncate(self.macro_mark)
+                self.log_message += f" - Recorded {len(self.macro)} events"
+        elif self.recording:
+            self.log_message += " - Stop recording first"
+        elif option == "Play Once":
+            self.player = MacroPlayer(self.macro, self.MACRO_SPEED)
+            self.log_message += f" - Playing {len(self.macro)} events"
+        elif option == "Play Many":
+            self.play_headless(self.macro, self.PLAY_MANY_COUNT)
+        elif option == "Open Macro":
+            try:
+                self.macro = Macro.load(self.MACRO_FILE)
+                self.log_message += f" - Loaded {len(self.macro)} events from {self.MACRO_FILE}"
+            except (OSError, ValueError) as e:
+                self.log_message += f" - Could not open macro: {e}"
+        else:  # Save Macro
+            try:
+                self.macro.save(self.MACRO_FILE)
+                self.log_message += f" - Saved {len(self.macro)} events to {self.MACRO_FILE}"
+            except OSError as e:
+                self.log_message += f" - Could not save macro: {e}"
+
+    def play_headless(self, macro, iterations):
+        # Replay a macro back to back as fast as possible, drawing at most
+        # every HEADLESS_DRAW_INTERVAL seconds. Used for load tests and bulk edits.
+        events = [(key, mouse) for _seconds, key, mouse in macro.events()]
+        start = last_draw = time.monotonic()
+        self.playing = True
+        try:
+            for _i in range(iterations):
+                for key, mouse in events:
+                    self.dispatch(key, mouse)
+                if self.HEADLESS_DRAW_INTERVAL is not None:
+                    now = time.monotonic()
+                    if now - last_draw >= self.HEADLESS_DRAW_INTERVAL:
+                        self.draw_ui()
+                        last_draw = now
+        finally:
+            self.playing = False
+        elapsed = max(time.monotonic() - start, 1e-9)
+        count = len(events) * iterations
+        self.log_message = (f"Played macro {iterations}x: {count} events in {elapsed:.2f}s "
+                            f"({count / elapsed:.0f} events/s)")
+
+    def dispatch(self, key, mouse):
+        # Apply one input event. Returns False when the application should quit.
+        if self.recording and not self.playing:
+            self.macro.record(key, mouse)
+        # Edits caused by one event are undone together.
+        self.history.begin()
         try:
-            self.stdscr.addstr(max_y - 1, 0, "Log: " + self.log_message[:max_x - 5], curses.color_pair(1))
-        except curses.error:
-            pass
-        self.stdscr.refresh()
-        return left_toolbar
+            with self.profiler.timer("events"):
+                if key == curses.KEY_RESIZE:
+                    self.resize()  # Also while a popup is open, which any other key closes.
+                elif self.modal:
+                    self.handle_modal_event(key, mouse)
+                elif not self.handle_keypress(key):
+                    return self.playing  # A recorded quit key doesn't end playback.
+                elif mouse:
+                    self.handle_mouse_event(mouse[0], mouse[1], mouse[2], self.left_toolbar)
+        finally:
+            self.relayout()
+            self.history.end()
+        return True
+
+    def handle_modal_event(self, key, mouse):
+        # The open popup or property editor takes the event; it returns the
+        # log message once the event closes it.
+        message = self.modal.handle(key, mouse)
+        if message is not None:
+            self.modal = None
+            self.log_message = f"Key pressed: {key} (Code: {key})" + message
+
+    def draw_ui(self):
+        self.renderer.render(self)
+        return self.left_toolbar
 
     def handle_keypress(self, key):
         self.log_message = f"Key pressed: {key} (Code: {key})"
+        if self.elements_menu_open and self.handle_elements_menu_key(key):
+            return True
         if key == 17:  # Option-Q
             self.log_message += " - Option-Q: Quit"
             return False  # Exit the application
         elif key == 19:  # Option-S
-            UIManager.save_layout(self.elements)
-            self.log_message += " - Option-S: Layout saved"
+            self.journal.save()
+            self.log_message += " - Option-S: Layout saved; " + summary(self.lint_layout())
+        elif key == 12:  # Option-L
+            problems = self.lint_layout()
+            shown = [describe(problem) for problem in problems[:self.LINT_SHOWN]]
+            self.modal = PopupManager.lint_popup(summary(problems), shown, len(problems) - len(shown))
+            self.log_message += " - Option-L: " + summary(problems)
         elif key == 8:  # Option-H
-            PopupManager.show_help_popup(self.stdscr)
+            self.modal = PopupManager.help_popup()
             self.log_message += " - Option-H: Help popup shown"
         elif key == ord('e') and self.selected_element:
-            PopupManager.edit_properties(self.stdscr, self.selected_element)
+            self.modal = PopupManager.edit_properties(list(self.selection))
             self.log_message += " - 'e': Edit properties"
+        elif key == 16:  # Option-P
+            self.profiler.toggle_overlay()
+            self.log_message += " - Option-P: Profiler overlay " + ("shown" if self.profiler.overlay else "hidden")
+        elif key in (curses.KEY_PPAGE, curses.KEY_NPAGE):
+            page = ToolbarManager.canvas_rect(*self.stdscr.getmaxyx())[2] - 1
+            self.scroll_by(page if key == curses.KEY_NPAGE else -page, 0)
+        elif key in self.SCROLL_KEYS:
+            self.scroll_by(*self.SCROLL_KEYS[key])
+        elif key == curses.KEY_HOME:
+            self.scroll_y, self.scroll_x = 0, 0
+            self.log_message += " - Viewport reset"
+        elif key in self.MOVE_KEYS and self.selection:
+            self.elements.translate(list(self.selection), *self.MOVE_KEYS[key])
+            self.log_message += f" - Moved {len(self.selection)} elements"
+        elif key == 1:  # Option-A
+            self.selection.set(self.elements)
+            self.log_message += f" - Option-A: Selected all {len(self.selection)} elements"
+        elif key == 27 and self.selection:  # Escape
+            self.selection.clear()
+            self.log_message += " - Selection cleared"
+        elif key == 7:  # Option-G
+            self.snapping = not self.snapping
+            self.log_message += " - Option-G: Snapping " + ("on" if self.snapping else "off")
         elif key == 3:  # Option-C
             self.log_message += " - Option-C: No action performed"
         return True
@@ -90,6 +452,9 @@ class Application:
                 return
             elif 18 <= mx <= 18 + len(" Macros "):
                 self.macros_menu_open = not self.macros_menu_open
+                if self.recording and self.macros_menu_open:
+                    # Drop this click and the menu choice that follows from the recording.
+                    self.macro_mark = len(self.macro) - 1
                 self.file_menu_open = False
                 self.edit_menu_open = False
                 self.elements_menu_open = False
@@ -97,37 +462,44 @@ class Application:
                 return
             elif 28 <= mx <= 28 + len(" Elements "):
                 self.elements_menu_open = not self.elements_menu_open
+                self.elements_menu_query = ""
+                self.elements_menu_scroll = self.elements_menu_cursor = 0
                 self.file_menu_open = False
                 self.edit_menu_open = False
                 self.macros_menu_open = False
                 self.log_message += " - Toggled Elements menu"
                 return
             elif 40 <= mx <= 40 + len(" Delete Control "):
-                if self.selected_element in self.elements:
-                    self.elements.remove(self.selected_element)
-                    self.log_message += " - Deleted selected control"
-                    self.selected_element = None
+                if self.selection:
+                    count = len(self.selection)
+                    self.elements.remove_many(list(self.selection))
+                    self.log_message += f" - Deleted {count} selected controls"
                 return
             elif 58 <= mx <= 58 + len(" Help "):
-                PopupManager.show_help_popup(self.stdscr)
+                self.modal = PopupManager.help_popup()
                 self.log_message += " - Help popup shown"
                 return
 
         # File menu dropdown.
-        if self.file_menu_open and my == 1 and 2 <= mx <= 20 and (bstate & curses.BUTTON1_PRESSED):
-            UIManager.save_layout(self.elements)
-            self.log_message += " - Saved via File menu"
-            self.file_menu_open = False
-            return
+        if self.file_menu_open and my >= 1 and 2 <= mx <= 20 and (bstate & curses.BUTTON1_PRESSED):
+            file_options = ToolbarManager.MENUS["file"][1]
+            idx = my - 1  # first item at row 1
+            if 0 <= idx < len(file_options):
+                self.file_menu_open = False
+                self.handle_file_option(file_options[idx])
+                return
 
-        # Elements menu dropdown.
+        # Elements menu dropdown: a search line at row 1, matches below it.
         if self.elements_menu_open and my >= 1:
-            start_x = 28
-            idx = my - 1  # first item at row 1
-            if 0 <= idx < len(self.elements):
-                self.selected_element = self.elements[idx]
-                self.log_message += f" - Selected element {idx} from Elements menu"
-                self.elements_menu_open = False
+            max_y, max_x = self.stdscr.getmaxyx()
+            matches = self.elements_menu_matches()
+            if intersects(ToolbarManager.elements_menu_rect(len(matches), max_y, max_x), (my, mx, 1, 1)):
+                if bstate & (self.WHEEL_UP | self.WHEEL_DOWN):
+                    rows = ToolbarManager.elements_menu_rows(len(matches), max_y)
+                    step = -self.WHEEL_STEP if bstate & self.WHEEL_UP else self.WHEEL_STEP
+                    self.elements_menu_scroll = max(0, min(self.elements_menu_scroll + step, len(matches) - rows))
+                elif my >= 2 and bstate & curses.BUTTON1_PRESSED:
+                    self.select_from_elements_menu(self.elements_menu_scroll + my - 2)
                 return
 
         # Macros menu dropdown.
@@ -138,7 +510,8 @@ class Application:
             if 0 <= idx < len(macros_options):
                 self.log_message += f" - Selected '{macros_options[idx]}' from Macros menu"
                 self.macros_menu_open = False
-                # Add logic for handling each macro option here.
+                if not self.playing:
+                    self.handle_macro_option(macros_options[idx])
                 return
 
         # Edit menu dropdown.
@@ -149,85 +522,351 @@ class Application:
             if 0 <= idx < len(edit_options):
                 self.log_message += f" - Selected '{edit_options[idx]}' from Edit menu"
                 self.edit_menu_open = False
-                # Add logic for handling each edit option here.
+                if not self.handle_edit_option(edit_options[idx]):
+                    self.log_message += " (nothing to do)"
                 return
 
+        # Mouse wheel scrolls the canvas; with Shift held, sideways.
+        if bstate & (self.WHEEL_UP | self.WHEEL_DOWN):
+            step = -self.WHEEL_STEP if bstate & self.WHEEL_UP else self.WHEEL_STEP
+            if bstate & curses.BUTTON_SHIFT:
+                self.scroll_by(0, step)
+            else:
+                self.scroll_by(step, 0)
+            return
+
         # Left toolbar region: Drag elements onto the canvas with left-click.
         if bstate & curses.BUTTON1_PRESSED:
-            for item in left_toolbar:
-                # Allow clicking anywhere within the element's outline
-                if item.y <= my <= item.y + 2 and item.x <= mx <= item.x + item.width + 1:
-                    if isinstance(item, PopupButton):
-                        new_element = PopupButton(my, mx + 25, 10, "[ Popup ]")
-                    elif isinstance(item, Checkbox):
-                        new_element = Checkbox(my, mx + 25, "New Checkbox")
-                    elif isinstance(item, TextInput):
-                        new_element = TextInput(my, mx + 25, 15, "")
-                    elif isinstance(item, UIElement) and "[ Button ]" in item.text:
-                        new_element = UIElement(my, mx + 25, 10, "[ Button ]")
-                    else:
-                        continue
-                    # Adjust the initial position to center canvas
-                    new_element.x = 30  # Example center canvas X position
-                    new_element.y = 10  # Example center canvas Y position
-                    self.elements.append(new_element)
-                    self.selected_element = new_element
-                    self.selected_element.dragging = True
-                    self.log_message += " - Dragging new element from toolbar with left-click"
-                    return
+            # Allow clicking anywhere within the element's outline
+            for item in self.left_toolbar_index.query_point(my, mx):
+                if isinstance(item, PopupButton):
+                    new_element = PopupButton(my, mx + 25, 10, "[ Popup ]")
+                elif isinstance(item, Checkbox):
+                    new_element = Checkbox(my, mx + 25, "New Checkbox")
+                elif isinstance(item, TextInput):
+                    new_element = TextInput(my, mx + 25, 15, "")
+                elif isinstance(item, UIElement) and "[ Button ]" in item.text:
+                    new_element = UIElement(my, mx + 25, 10, "[ Button ]")
+                else:
+                    continue
+                # Adjust the initial position to center canvas
+                new_element.x = 30 + self.scroll_x  # Example center canvas X position
+                new_element.y = 10 + self.scroll_y  # Example center canvas Y position
+                self.start_gesture()
+                self.add_element(new_element)
+                self.selected_element = new_element
+                self.selected_element.dragging = True
+                self.edges.suspend([new_element])
+                self.log_message += " - Dragging new element from toolbar with left-click"
+                return
+
+        # The rest works on the canvas under the mouse.
+        in_canvas = intersects(ToolbarManager.canvas_rect(*self.stdscr.getmaxyx()), (my, mx, 1, 1))
+        my, mx = my + self.scroll_y, mx + self.scroll_x
 
         # Handle dragging/resizing while the mouse is moved with BUTTON1_PRESSED.
-        if bstate & curses.BUTTON1_PRESSED:
-            if self.selected_element:
-                if self.selected_element.dragging:
-                    self.selected_element.x = mx
-                    self.selected_element.y = my
-                    self.log_message += f" - Dragging to ({mx},{my})"
-                elif self.selected_element.resizing:
-                    new_width = max(5, mx - self.selected_element.x - 1)
-                    self.selected_element.width = new_width
-                    self.log_message += f" - Resizing to width {new_width}"
+        if bstate & curses.BUTTON1_PRESSED or (self.band or self.move_anchor) and \
+                bstate & curses.REPORT_MOUSE_POSITION:
+            selected = self.selected_element
+            if self.band:
+                self.band = self.band[:2] + (my, mx)
+            elif self.move_anchor:
+                top, left, height, width = self.move_rect
+                y, x = self.snap(top + my - self.move_anchor[0], left + mx - self.move_anchor[1], height, width)
+                dy, dx = y - top - self.move_offset[0], x - left - self.move_offset[1]
+                if dy or dx:
+                    self.elements.translate(list(self.selection), dy, dx)
+                    self.move_offset = (y - top, x - left)
+                    self.log_message += f" - Moving {len(self.selection)} elements"
+            elif selected and selected.dragging:
+                _y, _x, height, width = selected.bounds()
+                selected.y, selected.x = self.snap(my, mx, height, width)
+                self.log_message += f" - Dragging to ({selected.x},{selected.y})"
+            elif selected and selected.resizing:
+                new_width = max(self.MIN_WIDTH, mx - selected.x - 1)
+                self.elements.resize(list(self.selection), new_width - selected.width, self.MIN_WIDTH)
+                self.log_message += f" - Resizing to width {new_width}"
+            elif in_canvas and bstate & curses.BUTTON1_PRESSED:
+                self.press_canvas(bstate, my, mx)
 
         elif bstate & curses.BUTTON1_RELEASED:
+            if self.band:
+                self.finish_band()
+            self.move_anchor = self.move_rect = None
+            self.guides = []
+            self.edges.resume()
             if self.selected_element:
                 self.selected_element.dragging = False
                 self.selected_element.resizing = False
                 self.log_message += " - Dragging or resizing completed"
+            self.end_gesture()
 
         # Right-click: select element for properties or movement.
         if bstate & curses.BUTTON3_PRESSED:
-            for element in self.elements:
+            self.start_gesture()
+            for element in (self.index.query_point(my, mx) if in_canvas else ()):
                 if element.is_within(my, mx):
-                    self.selected_element = element
+                    self.select(element)
                     self.log_message += " - Element selected via right-click"
                 elif element.is_on_resize_handle(my, mx):
-                    self.selected_element = element
-                    self.selected_element.resizing = True
+                    self.select(element)
+                    element.resizing = True
                     self.log_message += " - Resizing initiated via right-click"
 
         elif bstate & curses.BUTTON3_RELEASED:
-            if self.selected_element:
-                if self.selected_element.resizing:
-                    self.selected_element.resizing = False
+            selected = self.selected_element
+            if selected:
+                if selected.resizing:
+                    selected.resizing = False
                     self.log_message += " - Resizing completed"
-                elif isinstance(self.selected_element, PopupButton):
-                    self.selected_element.show_popup(self.stdscr)
+                elif isinstance(selected, PopupButton):
+                    self.modal = selected.popup()
                     self.log_message += " - Popup displayed"
                 else:
-                    self.selected_element.x = mx
-                    self.selected_element.y = my
+                    # The selection moves along, keeping its arrangement.
+                    self.elements.translate(list(self.selection), my - selected.y, mx - selected.x)
                     self.log_message += f" - Moved to ({mx},{my})"
+            self.end_gesture()
+
+    def press_canvas(self, bstate, my, mx):
+        # Left button pressed on the canvas (in canvas coordinates). On an
+        # element it selects it and starts dragging the selection; with Shift
+        # it adds or removes the element instead. On empty canvas it starts a
+        # rubber band, which with Shift adds to the selection.
+        hits = self.index.query_point(my, mx)
+        element = hits[-1] if hits else None
+        shift = bool(bstate & curses.BUTTON_SHIFT)
+        if element and shift:
+            self.selection.toggle(element)
+            self.log_message += f" - {len(self.selection)} elements selected"
+        elif element:
+            self.select(element)
+            self.start_gesture()
+            self.move_anchor = (my, mx)
+            self.move_rect = self.selection_rect()
+            self.move_offset = (0, 0)
+            self.edges.suspend(self.selection)
+            self.log_message += f" - Selected element {element.id}"
+        else:
+            if not shift:
+                self.selection.clear()
+            self.band = (my, mx, my, mx)
+            self.band_adds = shift
+
+    def selection_rect(self):
+        # Canvas rectangle enclosing the bounds of the selected elements.
+        rects = [element.bounds() for element in self.selection]
+        top, left = min(r[0] for r in rects), min(r[1] for r in rects)
+        bottom, right = max(r[0] + r[2] for r in rects), max(r[1] + r[3] for r in rects)
+        return (top, left, bottom - top, right - left)
+
+    def snap(self, y, x, height, width):
+        # Where a dragged rectangle placed at (y, x) ends up: lined up with
+        # a nearby edge of an element that isn't being dragged, or else on
+        # the grid. Sets the alignment guides shown while dragging.
+        if not self.snapping:
+            self.guides = []
+            return y, x
+        y, x, self.guides = self.edges.snap((y, x, height, width), self.SNAP_DISTANCE, self.GRID)
+        return y, x
+
+    def band_rect(self):
+        # Canvas rectangle spanned by the rubber band.
+        y1, x1, y2, x2 = self.band
+        return (min(y1, y2), min(x1, x2), abs(y2 - y1) + 1, abs(x2 - x1) + 1)
+
+    def finish_band(self):
+        # Select the elements lying entirely inside the rubber band.
+        rect = self.band_rect()
+        inside = [element for element in self.index.query_rect(rect)
+                  if intersection(element.bounds(), rect) == element.bounds()]
+        if self.band_adds:
+            for element in inside:
+                self.selection.add(element)
+        else:
+            self.selection.set(inside)
+        self.band = None
+        self.log_message += f" - {len(self.selection)} elements selected"
+
+    def read_events(self, timeout):
+        # Wait up to `timeout` ms (-1 blocks) for input, then drain everything
+        # already queued without waiting. Returns (key, mouse) pairs in arrival
+        # order, where mouse is (bstate, mx, my) for KEY_MOUSE and None
+        # otherwise. Runs of motion reports with the same button state are
+        # collapsed into the latest position; presses and releases are kept.
+        # A burst of KEY_RESIZE is one event: getmaxyx() has the latest size.
+        events = []
+        self.stdscr.timeout(timeout)
+        key = self.stdscr.getch()
+        self.stdscr.timeout(0)
+        while key != -1:
+            mouse = None
+            if key == curses.KEY_MOUSE:
+                try:
+                    _id, mx, my, _z, bstate = screen.getmouse()
+                    mouse = (bstate, mx, my)
+                except curses.error:
+                    pass
+            if key == curses.KEY_RESIZE and (key, None) in events:
+                pass
+            elif (mouse and mouse[0] & curses.REPORT_MOUSE_POSITION and events
+                    and events[-1][1] and events[-1][1][0] == mouse[0]):
+                events[-1] = (key, mouse)
+            else:
+                events.append((key, mouse))
+            key = self.stdscr.getch()
+        return events
 
     def run(self):
+        asyncio.run(self.main_loop())
+
+    async def main_loop(self):
+        # Draws at most frame_rate times per second and otherwise sleeps in
+        # the event loop until input arrives or a frame or macro event is
+        # due, so background tasks run while the user is idle.
         self.initialize_curses()
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()  # set on terminal input and by background tasks
+        try:
+            loop.add_reader(sys.stdin.fileno(), self.wakeup.set)
+            poll = None
+        except (NotImplementedError, ValueError, OSError):
+            # No readiness notifications for the terminal; poll every frame.
+            poll = 1.0 / self.frame_rate
+        try:
+            loop.add_signal_handler(signal.SIGWINCH, self.terminal_resized)
+            sigwinch = True
+        except (AttributeError, NotImplementedError, RuntimeError):
+            sigwinch = False  # curses reports KEY_RESIZE by itself.
+        tasks = [loop.create_task(task()) for task in self.background]
+        for task in tasks:
+            task.add_done_callback(self.background_done)
+        frame_time = 1.0 / self.frame_rate
+        next_frame = 0.0
+        pending = True  # state changed since the last frame
+        try:
+            while True:
+                now = time.monotonic()
+                if self.player:
+                    self.playing = True
+                    for key, mouse in self.player.due(now):
+                        pending = True
+                        self.dispatch(key, mouse)
+                    self.playing = False
+                    if self.player.done:
+                        self.player = None
+                if pending and now >= next_frame:
+                    self.draw_ui()
+                    next_frame = now + frame_time
+                    pending = False
+                # Wait for input, or only until the next frame or macro
+                # event is due.
+                wake = next_frame if pending else None
+                if self.player:
+                    due = self.player.next_due()
+                    wake = due if wake is None else min(wake, due)
+                timeout = None if wake is None else max(0.0, wake - now)
+                if poll is not None:
+                    timeout = poll if timeout is None else min(timeout, poll)
+                if not self.wakeup.is_set():
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                if self.wakeup.is_set():
+                    self.wakeup.clear()
+                    pending = True
+                events = self.read_events(0)
+                if self.resized:
+                    # However many SIGWINCHs came in, resize once to the latest size.
+                    self.resized = False
+                    size = os.get_terminal_size(sys.__stdout__.fileno())
+                    screen.resizeterm(size.lines, size.columns)
+                    if (curses.KEY_RESIZE, None) not in events:
+                        events.insert(0, (curses.KEY_RESIZE, None))
+                for key, mouse in events:
+                    pending = True
+                    if not self.dispatch(key, mouse):
+                        return
+        finally:
+            if poll is None:
+                loop.remove_reader(sys.stdin.fileno())
+            if sigwinch:
+                loop.remove_signal_handler(signal.SIGWINCH)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.journal.close()
+            if self.profiler.frames:
+                self.profiler.export(self.PROFILE_FILE)
+
+    def terminal_resized(self):
+        # SIGWINCH handler; the main loop resizes before its next events.
+        self.resized = True
+        self.wakeup.set()
+
+    def background_done(self, task):
+        if not task.cancelled() and task.exception():
+            self.log_message = f"Background task failed: {task.exception()!r}"
+            self.wakeup.set()
+
+    async def autosave(self):
+        # Make recorded edits durable every AUTOSAVE_INTERVAL seconds. The
+        # fsync runs on a worker thread, so input is never waiting for it.
+        loop = asyncio.get_running_loop()
         while True:
-            left_toolbar = self.draw_ui()
-            key = self.stdscr.getch()
-            if not self.handle_keypress(key):
-                break
-            if key == curses.KEY_MOUSE:
+            await asyncio.sleep(self.AUTOSAVE_INTERVAL)
+            if self.journal.unsynced:
+                fd = self.journal.flush()
                 try:
-                    _id, mx, my, _z, bstate = curses.getmouse()
-                except curses.error:
-                    continue
-                self.handle_mouse_event(bstate, mx, my, left_toolbar)
\ No newline at end of file
+                    await loop.run_in_executor(None, os.fsync, fd)
+                finally:
+                    os.close(fd)
+
+    async def watch_layout(self):
+        # Reload the layout file whenever another program rewrites it. The
+        # file is parsed on a worker thread; only applying the diff runs in
+        # the event loop.
+        watcher = LayoutWatcher()
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(watcher.INTERVAL)
+            if not watcher.poll():
+                continue
+            try:
+                items = await loop.run_in_executor(None, UIManager.load_snapshot, watcher.path)
+                self.reload_layout(items)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.log_message = f"Could not reload {UIManager.LAYOUT_FILE}: {e!r}"
+            self.wakeup.set()
+
+    def reload_layout(self, items):
+        # Make the canvas match a layout written by another program. Elements
+        # are matched by id and only the added, removed and changed ones are
+        # touched, as one undo step; selected elements stay selected unless
+        # their id is gone. New elements go on top, in file order.
+        added, removed, changed = self.elements.diff(items)
+        selected_ids = set(element.id for element in self.selection)
+        self.history.begin()
+        try:
+            self.elements.remove_many(removed)
+            for element, item in changed:
+                fresh = UIManager.element_from_dict(item)
+                element.y, element.x, element.width, element.text = fresh.y, fresh.x, fresh.width, fresh.text
+                element.constraints = fresh.constraints  # None when the item has none
+                for key in item:
+                    if key not in COMMON_KEYS and key != "constraints" and hasattr(element, key):
+                        setattr(element, key, getattr(fresh, key))
+            for item in added:
+                element = UIManager.element_from_dict(item)
+                self.add_element(element)
+                if element.id in selected_ids:
+                    self.selection.add(element)  # Same id, new type.
+        finally:
+            self.history.end()
+        self.relayout()
+        editing = getattr(self.modal, "elements", ())
+        if any(element not in self.elements for element in editing):
+            self.modal = None  # Elements in the property editor are gone.
+        self.log_message = (f"Reloaded {UIManager.LAYOUT_FILE}: {len(added)} added, "
+                            f"{len(removed)} removed, {len(changed)} changed")
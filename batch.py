@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .constraint_layout import ConstraintLayout
+from .element_store import ElementStore
+from .layout_compiler import flatten
+from .layout_lint import lint, summary
+from .toolbar_manager import ToolbarManager
+from .ui_element import ELEMENT_TYPES
+from .ui_manager import UIManager
+
+# Headless processing of many layout files, without a terminal. Every layout
+# is loaded with UIManager into the element classes (which validates it),
+# normalized (missing or repeated ids get fresh ones), laid out for a
+# terminal of --size (see constraint_layout), written back in the chosen
+# format, checked with layout_lint for that size, and rendered into a text
+# snapshot of what the canvas shows. Layouts are spread
+# over a pool of worker processes, one per core by default, so throughput
+# grows with the number of cores. A summary report with one entry per
+# layout is written as JSON and printed as a table. The exit status is 1
+# when a layout could not be read or has elements that could not be loaded.
+#
+#   python -m visual_curses.batch [--out DIR] [--format json|vcl] [--size 24x80] LAYOUT|DIR ...
+
+LAYOUT_SUFFIXES = (".json", UIManager.BINARY_SUFFIX)
+
+
+def find_layouts(paths):
+    # Layout files named on the command line or found under directories.
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _dirs, files in sorted(os.walk(path)):
+                found += [os.path.join(directory, name) for name in sorted(files)
+                          if name.endswith(LAYOUT_SUFFIXES)]
+        else:
+            found.append(path)
+    return found
+
+
+def load_elements(items):
+    # Element objects for the dicts of a layout, in drawing order, with a
+    # fresh id for every element that has none or repeats an earlier one.
+    elements, errors = [], []
+    seen = set()
+    next_id = max([item["id"] for item in items if isinstance(item.get("id"), int)], default=0) + 1
+    for number, item in enumerate(items):
+        if item.get("type") not in ELEMENT_TYPES:
+            errors.append(f"element {number}: unknown type {item.get('type')!r}")
+            continue
+        if item.get("id") in seen or not isinstance(item.get("id"), int):
+            item = dict(item, id=next_id)
+            next_id += 1
+        try:
+            element = UIManager.element_from_dict(item)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"element {number}: {e!r}")
+            continue
+        seen.add(element.id)
+        elements.append(element)
+    return elements, errors
+
+
+def snapshot(elements):
+    # Text lines showing the elements as the canvas does, from canvas
+    # position (0, 0) or the top-left element, whichever is further up/left.
+    top, left, chars, _attrs = flatten(elements)
+    origin_y, origin_x = min(top, 0), min(left, 0)
+    lines = [""] * (top - origin_y)
+    for row in chars:
+        lines.append((" " * (left - origin_x) + "".join(" " if ch is None else ch for ch in row)).rstrip())
+    return lines
+
+
+def process_layout(path, out_path, size):
+    # Run every step on one layout; returns its entry in the report.
+    start = time.perf_counter()
+    entry = {"layout": path}
+    try:
+        items = UIManager.load_snapshot(path)
+        elements, errors = load_elements(items)
+        store = ElementStore(elements)
+        ConstraintLayout(store, ToolbarManager.canvas_rect(*size)).solve()
+        problems = lint(store, size)
+        UIManager.write_snapshot([element.to_dict() for element in store], out_path)
+        with open(os.path.splitext(out_path)[0] + ".txt", "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in snapshot(list(store)))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        entry.update(status="failed", error=repr(e), seconds=time.perf_counter() - start)
+        return entry
+    counts = {}
+    for _element, kind, _other in problems:
+        counts[kind] = counts.get(kind, 0) + 1
+    entry.update(status="invalid" if errors else "ok", output=out_path, elements=len(store),
+                 errors=errors, problems=counts, summary=summary(problems),
+                 seconds=time.perf_counter() - start)
+    return entry
+
+
+def output_path(path, base, out, suffix):
+    # Where a layout's processed copy goes: its place relative to `base`,
+    # mirrored under `out`, with the suffix of the output format.
+    relative = os.path.relpath(os.path.abspath(path), base)
+    target = os.path.join(out, os.path.splitext(relative)[0] + suffix)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m visual_curses.batch",
+                                     description="Validate, normalize, convert, lint and snapshot layouts.")
+    parser.add_argument("layouts", nargs="+", help="layout files, or directories searched for *.json and *.vcl")
+    parser.add_argument("--out", default="batch_out", help="directory for the results")
+    parser.add_argument("--format", choices=("json", "vcl"), help="output format (default: each input's own)")
+    parser.add_argument("--size", default="24x80", help="terminal size layouts are checked for, as LINESxCOLS")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--report", help="JSON report file (default: OUT/report.json)")
+    args = parser.parse_args(argv)
+    try:
+        size = tuple(int(part) for part in args.size.split("x"))
+    except ValueError:
+        size = ()
+    if len(size) != 2:
+        parser.error(f"--size must be LINESxCOLS, not {args.size!r}")
+
+    paths = find_layouts(args.layouts)
+    if not paths:
+        parser.error("no layout files found")
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    suffix = {"json": ".json", "vcl": UIManager.BINARY_SUFFIX}.get(args.format)
+    targets = [output_path(path, base, args.out, suffix or os.path.splitext(path)[1] or ".json")
+               for path in paths]
+
+    start = time.perf_counter()
+    jobs = max(1, min(args.jobs, len(paths)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        entries = list(pool.map(process_layout, paths, targets, [size] * len(paths),
+                                chunksize=max(1, len(paths) // (jobs * 4))))
+    elapsed = time.perf_counter() - start
+
+    for entry in entries:
+        if entry["status"] == "failed":
+            print(f"{entry['status']:<8} {entry['layout']}: {entry['error']}")
+        else:
+            print(f"{entry['status']:<8} {entry['layout']}: {entry['elements']} elements, {entry['summary']}")
+            for error in entry["errors"]:
+                print(f"{'':<8}   {error}")
+    failed = sum(1 for entry in entries if entry["status"] == "failed")
+    invalid = sum(1 for entry in entries if entry["status"] == "invalid")
+    elements = sum(entry.get("elements", 0) for entry in entries)
+    print(f"{len(entries)} layouts, {elements} elements, {failed} failed, {invalid} invalid, "
+          f"{elapsed:.2f}s on {jobs} processes")
+    report = args.report or os.path.join(args.out, "report.json")
+    with open(report, "w") as f:
+        json.dump({"size": list(size), "jobs": jobs, "seconds": elapsed, "layouts": entries}, f, indent=4)
+    return 1 if failed or invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import random
+import sys
+import time
+import tracemalloc
+from ..element_store import ElementStore, numpy
+from ..ui_element import UIElement
+
+# Memory per element and whole-layout scan time of the ElementStore against
+# the previous representation: a list of objects with a per-instance __dict__.
+# The store makes element views on demand, so it is measured twice: on its
+# own, and with a view of every element held elsewhere, as the canvas
+# indexes of the application hold them.
+#
+#   python -m visual_curses.benchmarks.element_store [element count]
+
+
+class DictElement:
+    # Stand-in for the element classes before they became store views.
+    def __init__(self, y, x, width, text=""):
+        self.id = 0
+        self.y = y
+        self.x = x
+        self.width = width
+        self.text = text
+        self.selected = False
+        self.dragging = False
+        self.resizing = False
+
+
+def build(cls, count, seed=0):
+    rng = random.Random(seed)
+    texts = ["[ Button ]", "[ Popup ]", "[ ] Option", ""]
+    return [cls(rng.randrange(1, 500), rng.randrange(21, 800), rng.randrange(5, 30), texts[i % 4])
+            for i in range(count)]
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(count):
+    tracemalloc.start()
+    legacy = build(DictElement, count)
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = ElementStore(build(UIElement, count))
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    held = list(store)
+    held_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    region = (100, 200, 50, 120)
+    top, left, height, width = region
+
+    def legacy_region():
+        return [el for el in legacy
+                if el.y < top + height and el.y + 3 > top and el.x < left + width and el.x + el.width + 2 > left]
+
+    def legacy_outside():
+        return [el for el in legacy
+                if el.y < 0 or el.y + 3 > 10 ** 6 or el.x < 21 or el.x + el.width + 2 > 21 + 10 ** 6]
+
+    def legacy_translate():
+        for el in legacy[::10]:
+            el.y += 1
+            el.x += 1
+
+    moved = list(store)[::10]
+    print(f"{count} elements, numpy {'on' if numpy is not None else 'off'}")
+    print(f"{'':<24} {'list of objects':>16} {'ElementStore':>14}")
+    print(f"{'bytes per element':<24} {legacy_bytes / count:>16.0f} {store_bytes / count:>14.0f}")
+    print(f"{'  with views held':<24} {legacy_bytes / count:>16.0f} {held_bytes / count:>14.0f}")
+    print(f"{'elements in region':<24} {timed(legacy_region):>13.2f} ms {timed(lambda: store.in_region(region)):>11.2f} ms")
+    print(f"{'bounds check':<24} {timed(legacy_outside):>13.2f} ms "
+          f"{timed(lambda: store.outside((0, 21, 10 ** 6, 10 ** 6))):>11.2f} ms")
+    del held
+    print(f"{'region, no views held':<24} {timed(legacy_region):>13.2f} ms "
+          f"{timed(lambda: store.in_region(region)):>11.2f} ms")
+    print(f"{'translate 10%':<24} {timed(legacy_translate):>13.2f} ms "
+          f"{timed(lambda: store.translate(moved, 1, 1)):>11.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
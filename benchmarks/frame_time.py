@@ -0,0 +1,160 @@
+import argparse
+import curses
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from .. import screen
+from ..application import Application
+from ..element_store import numpy
+from ..ui_element import UIElement
+from ..ui_manager import UIManager
+from .layout_load import make_items
+
+# Frame and input-handling cost of the whole UI, run against the in-memory
+# VirtualScreen so it needs no terminal. For every layout size and terminal
+# size it times draw_ui (full repaint, idle frame, frame after a one-cell
+# drag) and handle_mouse_event (selecting an element, a drag step, a click on
+# empty canvas). Each run is appended to a JSON lines file and compared with
+# the previous run in that file; slowdowns beyond --tolerance (and above the
+# --floor of timer noise) are reported and make the command exit with status 1.
+#
+#   python -m visual_curses.benchmarks.frame_time [--counts 10 1000] [--sizes 24x80]
+
+COUNTS = (10, 100, 1000, 10000, 100000)
+SIZES = ("24x80", "50x160", "100x300")
+TARGET = (10, 30)  # (y, x) of an element the mouse cases aim at
+
+
+def timed(fn, repeat, budget=2.0):
+    # Milliseconds per call: median and 95th percentile. Stops early once
+    # `budget` seconds are spent, after at least three calls.
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat and (len(samples) < 3 or time.perf_counter() - started < budget):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def cases(app):
+    target = UIElement(TARGET[0], TARGET[1], 10, "[ Button ]")
+    app.add_element(target)
+    app.selected_element = target
+    target.dragging = True
+    toolbar = app.left_toolbar
+    step = [0]
+
+    def drag():
+        step[0] ^= 1
+        app.handle_mouse_event(curses.BUTTON1_PRESSED, TARGET[1] + step[0], TARGET[0], toolbar)
+
+    def full():
+        app.renderer.invalidate_all()
+        app.draw_ui()
+
+    def select():
+        app.handle_mouse_event(curses.BUTTON3_PRESSED, TARGET[1] + 1, TARGET[0], toolbar)
+        app.handle_mouse_event(curses.BUTTON3_RELEASED, target.x, target.y, toolbar)
+        app.selected_element = target  # keep the drag cases moving this element
+        target.dragging = True
+
+    def drag_frame():
+        drag()
+        app.draw_ui()
+
+    def miss():
+        app.handle_mouse_event(curses.BUTTON1_PRESSED, 60, 20, toolbar)
+        app.handle_mouse_event(curses.BUTTON1_RELEASED, 60, 20, toolbar)
+        app.selected_element = target
+        target.dragging = True
+
+    return [("draw_full", full), ("draw_idle", app.draw_ui), ("draw_drag", drag_frame),
+            ("mouse_select", select), ("mouse_drag", drag), ("mouse_miss", miss)]
+
+
+def run(counts, sizes, repeat):
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for count in counts:
+                UIManager.write_snapshot(make_items(count))
+                for size in sizes:
+                    lines, cols = (int(part) for part in size.split("x"))
+                    virtual = screen.use(screen.VirtualScreen(lines, cols))
+                    app = Application(virtual.stdscr)
+                    app.initialize_curses()
+                    app.draw_ui()
+                    for name, fn in cases(app):
+                        median, p95 = timed(fn, repeat)
+                        results.append({"case": name, "elements": count, "size": size,
+                                        "median_ms": round(median, 4), "p95_ms": round(p95, 4)})
+                        print(f"{name:<14} {count:>8} {size:>9} {median:>10.3f} ms {p95:>10.3f} ms")
+                    app.journal.close()
+                    UIElement.image_cache.clear()
+                for path in os.listdir(tmp):
+                    os.remove(path)
+        finally:
+            os.chdir(cwd)
+            screen.use(curses)
+    return results
+
+
+def previous_run(path):
+    try:
+        with open(path) as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def regressions(previous, results, tolerance, floor):
+    before = dict(((r["case"], r["elements"], r["size"]), r["median_ms"]) for r in previous["results"])
+    slower = []
+    for result in results:
+        old = before.get((result["case"], result["elements"], result["size"]))
+        if old and result["median_ms"] > old * (1 + tolerance) and result["median_ms"] - old > floor:
+            slower.append((result, old))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m visual_curses.benchmarks.frame_time")
+    parser.add_argument("--counts", type=int, nargs="+", default=COUNTS, help="layout sizes in elements")
+    parser.add_argument("--sizes", nargs="+", default=SIZES, help="terminal sizes as LINESxCOLS")
+    parser.add_argument("--repeat", type=int, default=20, help="calls timed per case")
+    parser.add_argument("--results", default="frame_time.jsonl", help="JSON lines file runs are appended to")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown of a median reported as a regression")
+    parser.add_argument("--floor", type=float, default=0.05,
+                        help="slowdowns of fewer milliseconds than this are timer noise")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<14} {'elements':>8} {'size':>9} {'median':>13} {'p95':>13}")
+    results = run(args.counts, args.sizes, args.repeat)
+    previous = previous_run(args.results)
+    record = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "numpy": numpy is not None, "results": results}
+    with open(args.results, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    if previous is None:
+        return 0
+    slower = regressions(previous, results, args.tolerance, args.floor)
+    for result, old in slower:
+        print(f"regression: {result['case']} {result['elements']} elements {result['size']}: "
+              f"{old:.3f} ms -> {result['median_ms']:.3f} ms")
+    print(f"compared with the run of {previous['time']}: {len(slower)} regressions")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
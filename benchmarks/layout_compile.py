@@ -0,0 +1,119 @@
+import importlib.util
+import os
+import py_compile
+import sys
+import tempfile
+import time
+from .. import screen
+from ..layout_compiler import export_layout
+from ..screen import VirtualScreen, VirtualWindow
+from ..ui_element import UIElement
+from ..ui_manager import UIManager
+from .layout_load import make_items
+
+# Compares the interpreted rendering of a layout (layout.json parsed into
+# element objects, each drawn through the render cache) against the module
+# File > Export compiles from it: the time from file to first frame, the time
+# of a repeated frame, and the number of window calls each of them makes
+# (pads drawn included). Both draw into an in-memory window, and the two
+# frames are checked to be equal.
+#
+#   python -m visual_curses.benchmarks.layout_compile [element count ...]
+
+
+def count_calls(action):
+    # Number of window drawing calls action() makes, counted by wrapping the
+    # in-memory window methods while it runs.
+    calls = [0]
+    originals = {}
+    for name in ("addstr", "addch", "vline", "hline", "box", "overwrite"):
+        method = originals[name] = getattr(VirtualWindow, name)
+
+        def counted(*args, method=method):
+            calls[0] += 1
+            return method(*args)
+        setattr(VirtualWindow, name, counted)
+    try:
+        action()
+    finally:
+        for name, method in originals.items():
+            setattr(VirtualWindow, name, method)
+    return calls[0]
+
+
+def timed(action, repeat=1):
+    start = time.perf_counter()
+    for _run in range(repeat):
+        action()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(counts):
+    virtual = VirtualScreen()
+    previous = screen.backend
+    screen.use(virtual)
+    try:
+        print(f"{'elements':>8} {'':<12} {'first frame':>12} {'calls':>8} {'frame':>10} {'calls':>8}")
+        for count in counts:
+            run(virtual, count)
+    finally:
+        screen.use(previous)
+
+
+def run(virtual, count):
+    items = make_items(count)
+    lines = max(item["y"] for item in items) + 4
+    cols = max(item["x"] + item["width"] for item in items) + 3
+
+    def new_window():
+        win = virtual.newwin(lines, cols)
+        win.bkgd(" ", virtual.color_pair(1))
+        return win
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "layout.json")
+        module_path = os.path.join(tmp, "layout_view.py")
+        UIManager.write_snapshot(items, json_path)
+        export_layout(items, module_path)
+
+        def interpreted_start():
+            UIElement.image_cache.clear()
+            elements = [UIManager.element_from_dict(item) for item in UIManager.iter_snapshot(json_path)]
+            win = new_window()
+            for element in elements:
+                element.draw(win)
+            return elements, win
+
+        def compiled_start():
+            spec = importlib.util.spec_from_file_location("layout_view", module_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            win = new_window()
+            module.render(win, screen=screen)
+            return module, win
+
+        py_compile.compile(module_path)  # Byte-compiled, as an installed module is.
+        results = {}
+        for name, start in (("interpreted", interpreted_start), ("compiled", compiled_start)):
+            first = timed(start)
+            first_calls = count_calls(start)
+            drawn, win = start()
+            if name == "interpreted":
+                def frame():
+                    for element in drawn:
+                        element.draw(win)
+            else:
+                def frame():
+                    drawn.render(win, screen=screen)
+            elapsed = timed(frame, max(1, 20000 // count))
+            calls = count_calls(frame)
+            print(f"{count:>8} {name:<12} {first * 1000:>9.1f} ms {first_calls:>8} "
+                  f"{elapsed * 1000:>7.2f} ms {calls:>8}")
+            results[name] = win
+        if (results["interpreted"].chars, results["interpreted"].attrs) != \
+                (results["compiled"].chars, results["compiled"].attrs):
+            print(f"{count:>8} compiled frame differs from the interpreted one")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
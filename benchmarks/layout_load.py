@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from ..ui_manager import UIManager
+
+# Compares loading a large layout from layout.json against the binary format:
+# wall time and peak Python memory, both for decoding the element dicts and
+# for building the element objects the way Application does.
+#
+#   python -m visual_curses.benchmarks.layout_load [element count]
+
+
+def make_items(count, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for element_id in range(1, count + 1):
+        kind = rng.choice(("UIElement", "Checkbox", "TextInput", "PopupButton"))
+        item = {"type": kind, "id": element_id, "y": rng.randrange(1, 500), "x": rng.randrange(21, 800)}
+        if kind == "Checkbox":
+            item["text"] = f"[ ] Option {element_id % 100}"
+            item["width"] = len(item["text"])
+            item["checked"] = False
+        else:
+            item["text"] = {"UIElement": "[ Button ]", "TextInput": f"field {element_id}",
+                            "PopupButton": "[ Popup ]"}[kind]
+            item["width"] = rng.randrange(5, 30)
+        items.append(item)
+    return items
+
+
+def measure(label, load):
+    # Timed and memory-traced in separate runs: tracing slows allocations.
+    start = time.perf_counter()
+    count = load()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    load()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {count:>8} {elapsed * 1000:>10.1f} ms {peak / 2 ** 20:>10.1f} MiB")
+
+
+def main(count):
+    items = make_items(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "layout.json")
+        binary_path = os.path.join(tmp, "layout" + UIManager.BINARY_SUFFIX)
+        UIManager.write_snapshot(items, json_path)
+        UIManager.convert_layout(json_path, binary_path)
+        del items
+        print(f"json {os.path.getsize(json_path)} bytes, binary {os.path.getsize(binary_path)} bytes")
+        print(f"{'':<28} {'elements':>8} {'time':>13} {'peak':>14}")
+        for name, path in (("json", json_path), ("binary", binary_path)):
+            measure(f"{name}: decode", lambda: sum(1 for _item in UIManager.iter_snapshot(path)))
+            measure(f"{name}: build elements",
+                    lambda: len([UIManager.element_from_dict(item) for item in UIManager.iter_snapshot(path)]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,303 @@
+# Responsive layout. An element can carry constraints, a dict with a rule
+# for any of its "x", "y" and "width" fields:
+#
+#   x      ["left", n]  ["right", n]  ["center", n]   n cells in from that
+#                                                     edge, or right of the
+#                                                     middle of the frame
+#          ["align", id, n]  left edges lined up with element `id`, n apart
+#          ["after", id, n]  n cells to the right of element `id`
+#   y      ["top", n]  ["bottom", n]  ["center", n]  ["align", id, n]
+#          (bottom counts up from the bottom edge)
+#          ["below", id, n]
+#   width  ["percent", p]     p percent of the frame width, borders included
+#          ["match", id, n]   the width of element `id` plus n
+#
+# The frame is the canvas area of the screen (ToolbarManager.canvas_rect),
+# so pinned elements follow the terminal size. An offset of None means
+# "wherever the element is now" and is filled in at the next solve().
+#
+# ConstraintLayout is an element observer that keeps the constrained
+# elements indexed by what they depend on: each sibling they name, and the
+# frame's rows or columns. A resize or an edit marks only the elements
+# depending on what changed; solve() places them and, transitively, the
+# elements depending on those, anchors first. Unconstrained elements are
+# never visited, so a resize costs what is pinned to the frame rather than
+# what is in the layout. When something other than the solver moves or
+# resizes a constrained element (a drag, an undo, the property editor) its
+# offsets are re-derived so it stays where it was put.
+
+X_RULES = ("left", "right", "center", "align", "after")
+Y_RULES = ("top", "bottom", "center", "align", "below")
+WIDTH_RULES = ("percent", "match")
+RULES = {"x": X_RULES, "y": Y_RULES, "width": WIDTH_RULES}
+SIBLING_RULES = ("align", "after", "below", "match")
+INWARD_RULES = ("right", "bottom")  # offsets counted towards the top/left
+# Keys of `dependents` for the elements that depend on the frame.
+FRAME_ROWS = "rows"
+FRAME_COLUMNS = "columns"
+HEIGHT = 3  # rows every element covers
+
+
+def direction(rule):
+    # Which way a rule's offset moves the element: 1 or -1.
+    return -1 if rule[0] in INWARD_RULES else 1
+
+
+def constraints_text(constraints):
+    # Constraints as the property editor shows them, without the offsets,
+    # e.g. "x=right y=below:12 width=50%"; "none" without any.
+    if not constraints:
+        return "none"
+    parts = []
+    for field in ("x", "y", "width"):
+        rule = constraints.get(field)
+        if rule is None:
+            continue
+        if rule[0] == "percent":
+            parts.append(f"{field}={rule[1]}%")
+        elif rule[0] in SIBLING_RULES:
+            parts.append(f"{field}={rule[0]}:{rule[1]}")
+        else:
+            parts.append(f"{field}={rule[0]}")
+    return " ".join(parts)
+
+
+def without_offsets(constraints):
+    # The same rules, with offsets to be taken from wherever the element is.
+    if not constraints:
+        return constraints
+    return dict((field, rule if rule[0] == "percent" else rule[:-1] + [None])
+                for field, rule in constraints.items())
+
+
+def check_constraints(constraints):
+    # Raise ValueError unless `constraints` (as loaded from a layout) is a
+    # dict of well-formed rules.
+    if not isinstance(constraints, dict):
+        raise ValueError(f"constraints must be a dict, not {constraints!r}")
+    for field, rule in constraints.items():
+        if field not in RULES or not isinstance(rule, list) or not rule or rule[0] not in RULES[field]:
+            raise ValueError(f"bad constraint {field!r}: {rule!r}")
+        arguments = rule[1:]
+        if rule[0] == "percent":
+            valid = len(arguments) == 1 and isinstance(arguments[0], int)
+        elif rule[0] in SIBLING_RULES:
+            valid = len(arguments) == 2 and isinstance(arguments[0], int) and isinstance(arguments[1], (int, type(None)))
+        else:
+            valid = len(arguments) == 1 and isinstance(arguments[0], (int, type(None)))
+        if not valid:
+            raise ValueError(f"bad constraint {field!r}: {rule!r}")
+
+
+def parse_constraints(text):
+    # The inverse of constraints_text(), with every offset None so the
+    # elements stay where they are; None for "none". Raises ValueError.
+    if text.strip().lower() == "none":
+        return None
+    constraints = {}
+    for part in text.split():
+        field, _equals, value = part.partition("=")
+        kind, _colon, argument = value.partition(":")
+        if field not in RULES:
+            raise ValueError(f"unknown field {field!r}")
+        if field == "width" and kind.endswith("%"):
+            constraints[field] = ["percent", int(kind[:-1])]
+        elif kind not in RULES[field]:
+            raise ValueError(f"unknown rule {kind!r} for {field}")
+        elif kind in SIBLING_RULES:
+            constraints[field] = [kind, int(argument), None]
+        else:
+            constraints[field] = [kind, None]
+    return constraints or None
+
+
+class ConstraintLayout:
+    def __init__(self, elements, frame, minimum=1):
+        self.elements = elements  # the ElementStore laid out
+        self.frame = frame        # (y, x, height, width) the edges refer to
+        self.minimum = minimum    # narrowest width a rule may give
+        self.dependents = {}      # sibling id, FRAME_ROWS or FRAME_COLUMNS -> elements
+        self.filed = {}           # element -> constraints it is filed under
+        self.dirty = set()        # elements to place at the next solve()
+        self.moved = set()        # elements moved by others, to re-derive
+        self.solving = False
+        self.cycles = []          # elements left in place by the last solve()
+        for element in elements:
+            self.file(element)
+
+    def file(self, element):
+        constraints = element.constraints
+        if not constraints:
+            return
+        self.filed[element] = constraints
+        for key in self.anchors(constraints):
+            self.dependents.setdefault(key, set()).add(element)
+        self.dirty.add(element)
+        if any(rule[-1] is None and rule[0] != "percent" for rule in constraints.values()):
+            self.moved.add(element)
+
+    def unfile(self, element):
+        constraints = self.filed.pop(element, None)
+        if constraints is None:
+            return
+        for key in self.anchors(constraints):
+            dependents = self.dependents.get(key)
+            if dependents is not None:
+                dependents.discard(element)
+                if not dependents:
+                    del self.dependents[key]
+
+    def anchors(self, constraints):
+        # What the constraints depend on, as keys of `dependents`.
+        keys = set()
+        for field, rule in constraints.items():
+            if rule[0] in SIBLING_RULES:
+                keys.add(rule[1])
+            elif field == "y":
+                keys.add(FRAME_ROWS)
+            else:
+                keys.add(FRAME_COLUMNS)
+        return keys
+
+    def set_frame(self, frame):
+        # Mark the elements pinned to the axes of the frame that changed.
+        old, self.frame = self.frame, frame
+        if (old[0], old[2]) != (frame[0], frame[2]):
+            self.dirty.update(self.dependents.get(FRAME_ROWS, ()))
+        if (old[1], old[3]) != (frame[1], frame[3]):
+            self.dirty.update(self.dependents.get(FRAME_COLUMNS, ()))
+
+    def pending(self):
+        return bool(self.dirty or self.moved)
+
+    def base(self, element, field, rule):
+        # Where a rule puts a field, before its offset; None when the sibling
+        # it names is not on the canvas.
+        kind = rule[0]
+        top, left, height, width = self.frame
+        if kind in SIBLING_RULES:
+            sibling = self.elements.get(rule[1])
+            if sibling is None or sibling is element:
+                return None
+            if kind == "after":
+                return sibling.x + sibling.width + 2
+            if kind == "below":
+                return sibling.y + HEIGHT
+            return getattr(sibling, field)  # "align" and "match"
+        if field == "width":
+            return max(self.minimum, width * rule[1] // 100 - 2)
+        if field == "x":
+            size = element.width + 2
+            return {"left": left, "right": left + width - size, "center": left + (width - size) // 2}[kind]
+        return {"top": top, "bottom": top + height - HEIGHT, "center": top + (height - HEIGHT) // 2}[kind]
+
+    def derive(self, element):
+        # Offsets that keep an element where something else put it.
+        constraints = dict(element.constraints or {})
+        for field, rule in constraints.items():
+            base = self.base(element, field, rule)
+            if base is None:
+                continue
+            value = getattr(element, field)
+            if rule[0] == "percent":
+                if value != base:
+                    constraints[field] = ["percent", round((value + 2) * 100 / max(self.frame[3], 1))]
+            elif rule[-1] is None or base + direction(rule) * rule[-1] != value:
+                constraints[field] = rule[:-1] + [direction(rule) * (value - base)]
+        element.constraints = constraints
+
+    def solve(self):
+        # Place the marked elements and everything depending on them.
+        # Returns how many elements were visited.
+        self.solving = True
+        try:
+            moved, self.moved = self.moved, set()
+            for element in moved:
+                if element in self.filed:
+                    self.derive(element)
+                    self.dirty.update(self.dependents.get(element.id, ()))
+            order = self.order(self.dirty)
+            self.dirty.clear()
+            for element in order:
+                constraints = element.constraints
+                for field in ("width", "x", "y"):  # x may depend on the width
+                    rule = constraints.get(field)
+                    value = None if rule is None else self.base(element, field, rule)
+                    if value is None:
+                        continue
+                    if rule[0] != "percent":
+                        value += direction(rule) * rule[-1]
+                    if field == "width":
+                        value = max(value, self.minimum)
+                    setattr(element, field, value)
+        finally:
+            self.solving = False
+        return len(order)
+
+    def order(self, seeds):
+        # The seeds and their transitive dependents, each after the siblings
+        # it names. An element closing a cycle of constraints is left out
+        # and listed in `cycles`.
+        affected = set()
+        stack = [element for element in seeds if element in self.filed]
+        while stack:
+            element = stack.pop()
+            if element not in affected:
+                affected.add(element)
+                stack.extend(self.dependents.get(element.id, ()))
+        order, done, visiting = [], set(), set()
+        self.cycles = []
+        for start in affected:
+            stack = [(start, False)]
+            while stack:
+                element, expanded = stack.pop()
+                if expanded:
+                    visiting.discard(element)
+                    done.add(element)
+                    order.append(element)
+                    continue
+                if element in done or element in visiting:
+                    continue
+                visiting.add(element)
+                stack.append((element, True))
+                for rule in element.constraints.values():
+                    if rule[0] not in SIBLING_RULES:
+                        continue
+                    sibling = self.elements.get(rule[1])
+                    if sibling in visiting:
+                        self.cycles.append(element)
+                    elif sibling in affected and sibling not in done:
+                        stack.append((sibling, False))
+        if self.cycles:
+            cycles = set(self.cycles)
+            order = [element for element in order if element not in cycles]
+        return order
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self.file(element)
+        self.dirty.update(self.dependents.get(element.id, ()))
+
+    def element_removed(self, element):
+        self.unfile(element)
+        self.dirty.discard(element)
+        self.moved.discard(element)
+
+    def elements_removed(self, elements):
+        for element in elements:
+            self.element_removed(element)
+
+    def element_changed(self, element, name, old):
+        if name == "constraints":
+            self.unfile(element)
+            self.file(element)
+        elif name in ("y", "x", "width") and not self.solving:
+            # solve() already covers the dependents of what it places.
+            self.dirty.update(self.dependents.get(element.id, ()))
+            if element in self.filed:
+                self.moved.add(element)
+
+    def elements_translated(self, elements, dy, dx):
+        for element in elements:
+            self.element_changed(element, "y", None)
@@ -0,0 +1,181 @@
+from bisect import bisect_left, insort
+from collections import Counter
+
+
+class SortedEdges:
+    # Sorted list of edge positions, one entry per element edge, so equal
+    # positions repeat. Additions and removals are only counted and are
+    # applied when the list is next searched: a few by binary insertion and
+    # deletion, a whole batch (a selection being moved, deleted or restored
+    # by undo) in one linear pass.
+    BATCH = 64
+
+    def __init__(self, values=()):
+        self.values = sorted(values)
+        self.added = Counter()
+        self.dropped = Counter()
+
+    def __len__(self):
+        self.flush()
+        return len(self.values)
+
+    def add(self, value):
+        if self.dropped[value]:
+            self.dropped[value] -= 1
+        else:
+            self.added[value] += 1
+
+    def discard(self, value):
+        if self.added[value]:
+            self.added[value] -= 1
+        else:
+            self.dropped[value] += 1
+
+    def flush(self):
+        added, dropped = +self.added, +self.dropped  # Positive counts only.
+        self.added, self.dropped = Counter(), Counter()
+        values = self.values
+        if sum(dropped.values()) > self.BATCH:
+            kept = []
+            for value in values:
+                if dropped[value]:
+                    dropped[value] -= 1
+                else:
+                    kept.append(value)
+            values = self.values = kept
+        else:
+            for value, count in dropped.items():
+                i = bisect_left(values, value)
+                del values[i:i + count]
+        if sum(added.values()) > self.BATCH:
+            # Two sorted runs, which sorted() merges in linear time.
+            self.values = sorted(values + sorted(added.elements()))
+        else:
+            for value in added.elements():
+                insort(values, value)
+
+    def nearest(self, value, distance):
+        # The entry closest to value, if at most `distance` away; otherwise None.
+        if self.added or self.dropped:
+            self.flush()
+        values = self.values
+        i = bisect_left(values, value)
+        best = None
+        for candidate in values[max(i - 1, 0):i + 1]:
+            if abs(candidate - value) <= distance and (best is None or abs(candidate - value) < abs(best - value)):
+                best = candidate
+        return best
+
+
+class EdgeIndex:
+    # The outline edges of the canvas elements: the top, left, bottom and
+    # right border rows and columns of every element, one SortedEdges list
+    # per kind of edge. Finding the edge nearest to a position is a binary
+    # search, so snapping a drag to the other elements costs O(log n) per
+    # motion event. Elements being dragged are suspended: they are taken out
+    # of the lists so they don't snap to themselves, and their moves are
+    # ignored until resume() files them at their new place.
+    def __init__(self, elements=()):
+        self.edges = {}  # element -> (top, left, bottom, right) it is filed under
+        self.suspended = set()
+        for element in elements:
+            self.edges[element] = self._edges(element)
+        # SortedEdges of the tops, lefts, bottoms and rights, in the order of `edges`.
+        self.lists = tuple(SortedEdges(edges[i] for edges in self.edges.values()) for i in range(4))
+        self.tops, self.lefts, self.bottoms, self.rights = self.lists
+
+    def __len__(self):
+        return len(self.edges)
+
+    def _edges(self, element):
+        y, x, height, width = element.bounds()
+        return (y, x, y + height - 1, x + width - 1)
+
+    def insert(self, element):
+        if element in self.edges or element in self.suspended:
+            return
+        self.edges[element] = edges = self._edges(element)
+        for values, edge in zip(self.lists, edges):
+            values.add(edge)
+
+    def remove(self, element):
+        edges = self.edges.pop(element, None)
+        if edges is None:
+            return
+        for values, edge in zip(self.lists, edges):
+            values.discard(edge)
+
+    def update(self, element):
+        edges = self.edges.get(element)
+        if edges is not None and edges != self._edges(element):
+            self.remove(element)
+            self.insert(element)
+
+    def suspend(self, elements):
+        for element in elements:
+            self.remove(element)
+            self.suspended.add(element)
+
+    def resume(self):
+        suspended, self.suspended = self.suspended, set()
+        for element in suspended:
+            self.insert(element)
+
+    def align(self, lows, highs, low, high, distance):
+        # Shift that lines up the low or the high edge of a span with the
+        # nearest edge within distance, and that edge; (0, None) if there is
+        # none. Like edges meet (low on a low edge in `lows`, high on a high
+        # edge in `highs`); opposite edges are put side by side instead of on
+        # top of each other (low just past a high edge, high just before a
+        # low edge), so borders never overlap.
+        best = (0, None)
+        for own, values, gap in ((low, lows, 0), (high, highs, 0), (low, highs, 1), (high, lows, -1)):
+            edge = values.nearest(own - gap, distance)
+            if edge is not None and (best[1] is None or abs(edge + gap - own) < abs(best[0])):
+                best = (edge + gap - own, edge)
+        return best
+
+    def snap(self, rect, distance, grid=None):
+        # Snap a (y, x, height, width) rectangle to the edges of the indexed
+        # elements within distance, and otherwise to the (rows, columns)
+        # grid, if one is given. Returns the snapped (y, x) and the guides to
+        # draw: ("row", y) and ("column", x) for each edge it lined up with.
+        y, x, height, width = rect
+        guides = []
+        dy, row = self.align(self.tops, self.bottoms, y, y + height - 1, distance)
+        if row is not None:
+            guides.append(("row", row))
+        elif grid:
+            dy = round(y / grid[0]) * grid[0] - y
+        dx, column = self.align(self.lefts, self.rights, x, x + width - 1, distance)
+        if column is not None:
+            guides.append(("column", column))
+        elif grid:
+            dx = round(x / grid[1]) * grid[1] - x
+        return y + dy, x + dx, guides
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self.insert(element)
+
+    def element_removed(self, element):
+        self.remove(element)
+        self.suspended.discard(element)
+
+    def element_changed(self, element, name, old):
+        if name in ("y", "x", "width"):
+            self.update(element)
+
+    def elements_translated(self, elements, dy, dx):
+        edges = self.edges
+        shift = (dy, dx, dy, dx)
+        for element in elements:
+            old = edges.get(element)
+            if old is None:
+                continue  # Suspended.
+            new = edges[element] = tuple(edge + delta for edge, delta in zip(old, shift))
+            for values, before, after in zip(self.lists, old, new):
+                if before != after:
+                    values.discard(before)
+                    values.add(after)
@@ -0,0 +1,128 @@
+def trigrams(key):
+    return set(key[i:i + 3] for i in range(len(key) - 2))
+
+
+class ElementSearch:
+    # Type-to-filter search over the canvas elements for the Elements menu.
+    # Every element has a lower-case search key "<type> <text>"; a query
+    # matches when each of its whitespace-separated terms occurs in the key.
+    # Elements sharing a key are grouped, and a trigram index maps to the
+    # distinct keys, so a query only looks at the keys containing its longest
+    # term. The key groups are built the first time a search runs; the entry
+    # for a trigram is filled in the first time a query uses it. Both are then
+    # kept up to date through the element observer interface. `version`
+    # changes on every edit that can change a search result.
+    def __init__(self, elements, sort):
+        self.elements = elements  # ElementStore, iterated in drawing order
+        self.sort = sort          # callable putting elements into drawing order
+        self.built = False
+        self.keys = {}      # element -> search key
+        self.members = {}   # search key -> set of elements
+        self.grams = {}     # trigram -> set of search keys, for trigrams queried so far
+        self.version = 0
+        self.last = (None, None, [])  # (query, version, matches) of the last search
+
+    @staticmethod
+    def key(element):
+        return f"{element.__class__.__name__} {element.text}".lower()
+
+    def build(self):
+        keys, members, key_of = self.keys, self.members, self.key
+        for element in self.elements:
+            key = keys[element] = key_of(element)
+            bucket = members.get(key)
+            if bucket is None:
+                members[key] = {element}
+            else:
+                bucket.add(element)
+        self.built = True
+
+    def _add(self, element):
+        key = self.key(element)
+        self.keys[element] = key
+        bucket = self.members.get(key)
+        if bucket is None:
+            self.members[key] = {element}
+            for gram in trigrams(key):
+                keys = self.grams.get(gram)
+                if keys is not None:
+                    keys.add(key)
+        else:
+            bucket.add(element)
+
+    def _discard(self, element):
+        key = self.keys.pop(element, None)
+        if key is None:
+            return
+        bucket = self.members[key]
+        bucket.discard(element)
+        if not bucket:
+            del self.members[key]
+            for gram in trigrams(key):
+                keys = self.grams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+
+    def keys_with(self, gram):
+        keys = self.grams.get(gram)
+        if keys is None:
+            keys = self.grams[gram] = set(key for key in self.members if gram in key)
+        return keys
+
+    def search(self, query):
+        # Matching elements in drawing order.
+        last_query, last_version, last_matches = self.last
+        if query == last_query and self.version == last_version:
+            return last_matches
+        terms = query.lower().split()
+        if query[1:].isdigit() and query[0] == "#":
+            # "#12" looks the element up by its id.
+            element = self.elements.get(int(query[1:]))
+            matches = [element] if element else []
+            self.last = (query, self.version, matches)
+            return matches
+        if terms and not self.built:
+            self.build()
+        if not terms:
+            matches = list(self.elements)
+        elif last_query is not None and self.version == last_version and query.startswith(last_query):
+            # Typing narrows the previous result; filter it instead of the index.
+            keys = self.keys
+            matches = [element for element in last_matches if all(term in keys[element] for term in terms)]
+        else:
+            longest = max(terms, key=len)
+            if len(longest) >= 3:
+                candidates = None
+                for gram in trigrams(longest):
+                    keys = self.keys_with(gram)
+                    candidates = set(keys) if candidates is None else candidates & keys
+                    if not candidates:
+                        break
+            else:
+                candidates = self.members
+            found = []
+            for key in candidates:
+                if all(term in key for term in terms):
+                    found.extend(self.members[key])
+            matches = self.sort(found)
+        self.last = (query, self.version, matches)
+        return matches
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self.version += 1
+        if self.built:
+            self._add(element)
+
+    def element_removed(self, element):
+        self.version += 1
+        if self.built:
+            self._discard(element)
+
+    def element_changed(self, element, name, old):
+        if name == "text":
+            self.version += 1
+            if self.built:
+                self._discard(element)
+                self._add(element)
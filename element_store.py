@@ -0,0 +1,525 @@
+import weakref
+from array import array
+from itertools import chain
+from operator import attrgetter
+from .layout_format import COMMON_KEYS  # keys of a saved element dict kept in the columns
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Column positions in an element row. A detached element (one that is not in
+# any store) keeps the same values in a plain list in this order.
+ID, Y, X, WIDTH, FLAGS, TEXT, CONSTRAINTS = range(7)
+FIELD_NAMES = ("id", "y", "x", "width", "flags", "text", "constraints")
+
+# Bits of the FLAGS column.
+SELECTED = 1
+DRAGGING = 2
+RESIZING = 4
+CHECKED = 8
+EDITING = 16
+DELETED = 128  # Row of a removed element, dropped at the next compaction.
+
+ROW = attrgetter("_row")  # an element's row in its store
+
+
+def stack_below(order, below):
+    # The keys in `order` (bottom to top) with the entries listed in `below`
+    # (key -> entries) put just under their key, each entry with its own
+    # entries under it in turn; the entries under None go on top.
+    stacked = []
+    for key in chain(order, (None,)):
+        if key not in below:
+            if key is not None:
+                stacked.append(key)
+            continue
+        pending = [iter(below[key])]
+        entries = []
+        while pending:
+            entry = next(pending[-1], None)
+            if entry is None:
+                pending.pop()
+                if entries:
+                    stacked.append(entries.pop())
+            else:
+                entries.append(entry)
+                pending.append(iter(below.get(entry, ())))
+        if key is not None:
+            stacked.append(key)
+    return stacked
+
+
+class ElementStore:
+    # The canvas elements, kept as packed columns: one array per numeric
+    # field plus lists of texts and of constraints (see constraint_layout).
+    # The UIElement classes are __slots__ views that read and write their
+    # row, so the store behaves like the list it replaces (iteration in
+    # drawing order, len, indexing, `in`, append, remove) while bulk queries
+    # and translations run over whole columns. The store holds no view
+    # objects of its own: a row's view is made when it is asked for and is
+    # only weakly referenced from `refs`, so it lives as long as something
+    # else holds it and a row never has two views at once. Ids map to rows
+    # through the `id_rows` array, so get() finds an element without a scan.
+    # Removed rows are only flagged and are compacted away once they make up
+    # half of the store. Changes made through the views are reported to the
+    # objects in `observers` (element_added/element_removed/element_changed).
+    # Bulk removals and translations are reported in one call to observers
+    # that define elements_removed(elements) or
+    # elements_translated(elements, dy, dx), and element by element to the
+    # others.
+    def __init__(self, elements=()):
+        self.columns = [array("q"), array("i"), array("i"), array("i"), array("B"), [], []]
+        self.ids, self.ys, self.xs, self.widths, self.flags, self.texts, self.constraints = self.columns
+        self.kinds = array("B")  # row -> index of its element class in `classes`
+        self.classes = []
+        self.refs = []  # row -> KeyedRef (key: the row) to its view, or None
+        self.dropped = self.view_dropped  # one bound method shared by all refs
+        self.id_rows = array("i")  # element id -> row of the live element, -1 for none
+        self.far_ids = {}  # id -> row for ids too large for id_rows
+        self.live = 0
+        self.observers = []
+        self.above = {}  # see remove_many() and insert_many()
+        for element in elements:
+            self.append(element)
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        view = self.view
+        return (view(row) for row, flags in enumerate(self.flags) if not flags & DELETED)
+
+    def __contains__(self, element):
+        return getattr(element, "_store", None) is self
+
+    def __getitem__(self, index):
+        if self.live != len(self.flags):
+            self.compact()
+        return self.view(range(self.live)[index])
+
+    def kind(self, cls):
+        # Index of an element class in `classes`, adding it when new.
+        if cls not in self.classes:
+            self.classes.append(cls)
+        return self.classes.index(cls)
+
+    def view(self, row):
+        # The element stored in a row, made on demand.
+        ref = self.refs[row]
+        element = None if ref is None else ref()
+        if element is None:
+            cls = self.classes[self.kinds[row]]
+            element = cls.__new__(cls)
+            element._store = self
+            element._row = row
+            self.refs[row] = weakref.KeyedRef(element, self.dropped, row)
+        return element
+
+    def view_dropped(self, ref):
+        # Callback of the references in `refs`: nothing holds the view any more.
+        refs = self.refs
+        if ref.key < len(refs) and refs[ref.key] is ref:
+            refs[ref.key] = None
+
+    def row_of(self, element_id):
+        # Row of the live element with this id, or -1.
+        id_rows = self.id_rows
+        if 0 <= element_id < len(id_rows) and id_rows[element_id] >= 0:
+            return id_rows[element_id]
+        return self.far_ids.get(element_id, -1)
+
+    def file_id(self, element_id, row):
+        id_rows = self.id_rows
+        if not 0 <= element_id < len(id_rows):
+            if not 0 <= element_id < 4 * len(self.flags) + 1024:
+                self.far_ids[element_id] = row
+                return
+            id_rows.extend(array("i", [-1]) * (element_id + 1 - len(id_rows)))
+        id_rows[element_id] = row
+        self.far_ids.pop(element_id, None)
+
+    def unfile_id(self, element_id, row):
+        # Forget the id, if it still refers to `row`.
+        if 0 <= element_id < len(self.id_rows) and self.id_rows[element_id] == row:
+            self.id_rows[element_id] = -1
+        elif self.far_ids.get(element_id) == row:
+            del self.far_ids[element_id]
+
+    def append(self, element):
+        if element._store is not None:
+            element._store.remove(element)
+        values = element._row
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self.kinds.append(self.kind(element.__class__))
+        row = len(self.flags) - 1
+        element._store = self
+        element._row = row
+        self.refs.append(weakref.KeyedRef(element, self.dropped, row))
+        self.file_id(values[ID], row)
+        self.live += 1
+        for observer in self.observers:
+            observer.element_added(element)
+
+    def get(self, element_id, default=None):
+        # The live element with this id.
+        row = self.row_of(element_id)
+        return default if row < 0 else self.view(row)
+
+    def remove(self, element):
+        self.remove_many([element])
+
+    def remove_many(self, elements):
+        # Remove several elements at once; the store is compacted at most
+        # once afterwards instead of after every removal. Observers are told
+        # in drawing order, as if the elements were removed one by one, and
+        # meanwhile `above` maps each removed element to the element drawn
+        # just above it at its turn (None if it was on top), so that
+        # insert_many() can put it back where it was.
+        elements = list(elements)
+        for element in elements:
+            if element not in self:
+                raise ValueError("element is not in the store")
+        elements.sort(key=ROW)
+        flags = self.flags
+        for element in elements:
+            row = element._row + 1
+            while row < len(flags) and flags[row] & DELETED:
+                row += 1
+            self.above[element] = self.view(row) if row < len(flags) else None
+        for element in elements:
+            row = element._row
+            element._row = [column[row] for column in self.columns]
+            element._store = None
+            self.flags[row] |= DELETED
+            self.unfile_id(element._row[ID], row)
+            self.texts[row] = None
+            self.constraints[row] = None
+            self.refs[row] = None
+            self.live -= 1
+        try:
+            self.notify_removed(elements)
+        finally:
+            self.above = {}
+        if self.live * 2 < len(self.flags):
+            self.compact()
+
+    def notify_removed(self, elements):
+        for observer in self.observers:
+            bulk = getattr(observer, "elements_removed", None)
+            if bulk is not None:
+                bulk(elements)
+            else:
+                for element in elements:
+                    observer.element_removed(element)
+
+    def insert_many(self, placed):
+        # Take detached elements back in as if inserted one after the other,
+        # each (element, above) pair just below `above`: a live element or
+        # one inserted before it. Elements whose `above` is None or gone go
+        # on top. The store is rebuilt once for the lot. Observers are told
+        # in drawing order as for append(), with `above` set as in
+        # remove_many().
+        inserted = set(element for element, _above in placed)
+        if not any(above in self or above in inserted for _element, above in placed):
+            for element, _above in placed:
+                self.append(element)
+            return
+        for element, _above in placed:
+            if element._store is not None:
+                element._store.remove(element)
+        # The new values go in rows of their own at the end, to be moved
+        # into place by rebuild().
+        rows = {}  # inserted element -> its row
+        for element, _above in placed:
+            for column, value in zip(self.columns, element._row):
+                column.append(value)
+            self.kinds.append(self.kind(element.__class__))
+            self.refs.append(None)
+            rows[element] = len(self.flags) - 1
+        below = {}  # row or None -> rows to draw just below it
+        for element, above in placed:
+            if above in rows:
+                key = rows[above]
+            elif above in self:
+                key = above._row
+            else:
+                key = None
+            below.setdefault(key, []).append(rows[element])
+        live = [row for row, flags in enumerate(self.flags[:-len(rows)]) if not flags & DELETED]
+        renumbered = self.rebuild(stack_below(live, below))
+        for element, row in rows.items():
+            row = renumbered[row]
+            element._store = self
+            element._row = row
+            self.refs[row] = weakref.KeyedRef(element, self.dropped, row)
+            self.file_id(self.ids[row], row)
+            self.live += 1
+        added = sorted(rows, key=ROW)
+        for element in added:
+            row = element._row + 1
+            self.above[element] = self.view(row) if row < len(self.flags) else None
+        try:
+            for element in added:
+                for observer in self.observers:
+                    observer.element_added(element)
+        finally:
+            self.above = {}
+
+    def compact(self):
+        # Drop removed rows and renumber the remaining ones.
+        self.rebuild([row for row, flags in enumerate(self.flags) if not flags & DELETED])
+
+    def rebuild(self, order):
+        # Lay the rows out again in the order listed, dropping the others.
+        # Returns the array mapping old rows to new ones (-1 if dropped).
+        renumbered = array("i", [-1]) * len(self.flags)
+        for new_row, row in enumerate(order):
+            renumbered[row] = new_row
+        for index, column in enumerate(self.columns):
+            if index in (TEXT, CONSTRAINTS):
+                self.columns[index] = [column[row] for row in order]
+            else:
+                self.columns[index] = array(column.typecode, [column[row] for row in order])
+        self.ids, self.ys, self.xs, self.widths, self.flags, self.texts, self.constraints = self.columns
+        self.kinds = array("B", [self.kinds[row] for row in order])
+        self.refs = [self.refs[row] for row in order]
+        for row, ref in enumerate(self.refs):
+            element = None if ref is None else ref()
+            if element is not None:
+                ref.key = element._row = row
+        for index, row in enumerate(self.id_rows):
+            if row >= 0:
+                self.id_rows[index] = renumbered[row]
+        for element_id, row in self.far_ids.items():
+            self.far_ids[element_id] = renumbered[row]
+        return renumbered
+
+    def set(self, element, field, value):
+        # Write one field of an element's row and notify observers.
+        column = self.columns[field]
+        row = element._row
+        old = column[row]
+        if old == value:
+            return
+        column[row] = value
+        if field == ID:
+            self.unfile_id(old, row)
+            self.file_id(value, row)
+        name = FIELD_NAMES[field]
+        if name in element.WATCHED:
+            for observer in self.observers:
+                observer.element_changed(element, name, old)
+
+    def set_flag(self, element, bit, name, value):
+        row = element._row
+        old = bool(self.flags[row] & bit)
+        if old == bool(value):
+            return
+        if value:
+            self.flags[row] |= bit
+        else:
+            self.flags[row] &= ~bit & 0xFF
+        if name in element.WATCHED:
+            for observer in self.observers:
+                observer.element_changed(element, name, old)
+
+    # Bulk operations over whole columns. They use NumPy views of the arrays
+    # when it is installed and plain loops over the packed columns otherwise.
+
+    def _rows(self, predicate):
+        # Rows of live elements for which predicate(ys, xs, widths) holds;
+        # only called when NumPy is available.
+        ys = numpy.frombuffer(self.ys, dtype=numpy.int32)
+        xs = numpy.frombuffer(self.xs, dtype=numpy.int32)
+        widths = numpy.frombuffer(self.widths, dtype=numpy.int32)
+        flags = numpy.frombuffer(self.flags, dtype=numpy.uint8)
+        rows = numpy.flatnonzero(predicate(ys, xs, widths) & ((flags & DELETED) == 0)).tolist()
+        # Release the buffer views so the arrays can be resized again.
+        del ys, xs, widths, flags
+        return rows
+
+    def in_region(self, rect):
+        # Elements whose 3-row bounding box overlaps rect, in drawing order.
+        top, left, height, width = rect
+        bottom, right = top + height, left + width
+        if numpy is not None and self.flags:
+            rows = self._rows(lambda ys, xs, widths:
+                              (ys < bottom) & (ys + 3 > top) & (xs < right) & (xs + widths + 2 > left))
+        else:
+            rows = [row for row, (y, x, w, flags) in enumerate(zip(self.ys, self.xs, self.widths, self.flags))
+                    if y < bottom and y + 3 > top and x < right and x + w + 2 > left and not flags & DELETED]
+        view = self.view
+        return [view(row) for row in rows]
+
+    def outside(self, rect):
+        # Elements whose bounding box is not entirely inside rect.
+        top, left, height, width = rect
+        bottom, right = top + height, left + width
+        if numpy is not None and self.flags:
+            rows = self._rows(lambda ys, xs, widths:
+                              (ys < top) | (ys + 3 > bottom) | (xs < left) | (xs + widths + 2 > right))
+        else:
+            rows = [row for row, (y, x, w, flags) in enumerate(zip(self.ys, self.xs, self.widths, self.flags))
+                    if (y < top or y + 3 > bottom or x < left or x + w + 2 > right) and not flags & DELETED]
+        view = self.view
+        return [view(row) for row in rows]
+
+    def overlaps(self):
+        # live element -> another live element whose bounding box overlaps
+        # it, for every element that overlaps any other. A sweep line: each
+        # box is split into its rows, the row spans are sorted by (row, left)
+        # and one pass keeps the span reaching furthest right on the row so
+        # far; a span starting left of that reach overlaps the span holding
+        # it. This finds every overlapping element in O(n log n), naming one
+        # neighbour each rather than listing every overlapping pair.
+        view = self.view
+        if numpy is not None and self.flags:
+            flags = numpy.frombuffer(self.flags, dtype=numpy.uint8)
+            owners = numpy.flatnonzero((flags & DELETED) == 0)
+            ys = numpy.frombuffer(self.ys, dtype=numpy.int32)[owners].astype(numpy.int64)
+            xs = numpy.frombuffer(self.xs, dtype=numpy.int32)[owners].astype(numpy.int64)
+            widths = numpy.frombuffer(self.widths, dtype=numpy.int32)[owners]
+            del flags
+            if not len(owners):
+                return {}
+            # One number per row span for each end, ordering the spans by row
+            # and then column: the numbers of a row lie above those of the
+            # rows before it, so the running maximum of the right ends never
+            # carries over from one row to the next.
+            left = xs - xs.min()
+            stride = int((left + widths).max()) + 3
+            rows = numpy.concatenate([ys, ys + 1, ys + 2]) - ys.min()
+            lefts = rows * stride + numpy.tile(left, 3)
+            rights = rows * stride + numpy.tile(left + widths + 2, 3)
+            owners = numpy.tile(owners, 3)
+            order = numpy.argsort(lefts)
+            lefts, rights, owners = lefts[order], rights[order], owners[order]
+            reach = numpy.maximum.accumulate(rights)
+            positions = numpy.arange(len(rights))
+            holders = numpy.maximum.accumulate(numpy.where(rights == reach, positions, 0))
+            hits = numpy.flatnonzero(lefts[1:] < reach[:-1]) + 1
+            partners = numpy.full(len(self.flags), -1)
+            partners[owners[hits]] = owners[holders[hits - 1]]
+            partners[owners[holders[hits - 1]]] = owners[hits]
+            rows = numpy.flatnonzero(partners >= 0)
+            return dict((view(row), view(other)) for row, other in zip(rows.tolist(), partners[rows].tolist()))
+        # Without NumPy the same pass runs over plain integers, which sort
+        # far faster than tuples: each span is its left-end number shifted
+        # up past the bits of its index into `live`. The spans of the second
+        # and third rows are those of the first moved down one and two rows,
+        # so they are three sorted runs that the second sort merges.
+        live = [row for row, flags in enumerate(self.flags) if not flags & DELETED]
+        if not live:
+            return {}
+        ys, xs, widths = self.ys, self.xs, self.widths
+        top, left = min(ys[row] for row in live), min(xs[row] for row in live)
+        stride = max(xs[row] - left + widths[row] for row in live) + 3
+        bits = len(live).bit_length()
+        keys = [((ys[row] - top) * stride + xs[row] - left) << bits | index for index, row in enumerate(live)]
+        keys.sort()
+        step = stride << bits
+        keys += [key + step for key in keys] + [key + 2 * step for key in keys]
+        keys.sort()
+        ends = [widths[row] + 2 for row in live]
+        mask = (1 << bits) - 1
+        partners = [-1] * len(live)  # index into live of a neighbour found so far
+        reach, holder = -1, None
+        for key in keys:
+            index, start = key & mask, key >> bits
+            if start < reach:
+                if partners[index] < 0:
+                    partners[index] = holder
+                if partners[holder] < 0:
+                    partners[holder] = index
+            end = start + ends[index]
+            if end > reach:
+                reach, holder = end, index
+        return dict((view(live[index]), view(live[other]))
+                    for index, other in enumerate(partners) if other >= 0)
+
+    def extent(self):
+        # (top, left, bottom, right) enclosing every element's bounds, or None
+        # when the store is empty. Computed from the column minima and maxima,
+        # so it may be a little larger than the tightest box, and removed rows
+        # count until the next compaction.
+        if not self.live:
+            return None
+        return min(self.ys), min(self.xs), max(self.ys) + 3, max(self.xs) + max(self.widths) + 2
+
+    def diff(self, items):
+        # Compare element dicts, as saved in a layout, with the store by id.
+        # Returns (items with new ids, elements whose id is gone,
+        # [(element, item)] for ids whose fields differ). An id whose type
+        # changed counts as gone and new, and keys the element has no
+        # attribute for are ignored. Constraints are always compared, since
+        # an item without them clears them. Only the columns are read, so the
+        # elements' dicts are never built.
+        ys, xs, widths, texts, constraints = self.ys, self.xs, self.widths, self.texts, self.constraints
+        added, changed = [], []
+        seen = set()
+        for item in items:
+            row = self.row_of(item["id"])
+            if row < 0 or self.classes[self.kinds[row]].__name__ != item["type"]:
+                added.append(item)
+                continue
+            seen.add(row)
+            if (ys[row] != item["y"] or xs[row] != item["x"] or widths[row] != item["width"]
+                    or texts[row] != item["text"]
+                    or constraints[row] != (item.get("constraints") or None)
+                    or len(item) > len(COMMON_KEYS)
+                    and any(getattr(self.view(row), key, value) != value for key, value in item.items()
+                            if key not in COMMON_KEYS)):
+                changed.append((self.view(row), item))
+        rows = [row for row in self.id_rows if row >= 0] + list(self.far_ids.values())
+        removed = [self.view(row) for row in sorted(rows) if row not in seen]
+        return added, removed, changed
+
+    def translate(self, elements, dy, dx):
+        # Move several elements by the same offset. The elements are only
+        # read for their rows; the move itself is one operation per column.
+        moved = [element for element in elements if element._store is self]
+        if not moved or not (dy or dx):
+            return
+        if numpy is not None:
+            index = numpy.fromiter(map(ROW, moved), numpy.intp, len(moved))
+            ys = numpy.frombuffer(self.ys, dtype=numpy.int32)
+            xs = numpy.frombuffer(self.xs, dtype=numpy.int32)
+            ys[index] += dy
+            xs[index] += dx
+            del ys, xs
+        else:
+            for row in map(ROW, moved):
+                self.ys[row] += dy
+                self.xs[row] += dx
+        for observer in self.observers:
+            bulk = getattr(observer, "elements_translated", None)
+            if bulk is not None:
+                bulk(moved, dy, dx)
+                continue
+            for element in moved:
+                if dy:
+                    observer.element_changed(element, "y", self.ys[element._row] - dy)
+                if dx:
+                    observer.element_changed(element, "x", self.xs[element._row] - dx)
+
+    def resize(self, elements, dw, minimum=1):
+        # Change the width of several elements by the same amount, keeping
+        # each at least `minimum` wide.
+        resized = [element for element in elements if element._store is self]
+        rows = list(map(ROW, resized))
+        old = [self.widths[row] for row in rows]
+        if numpy is not None and rows:
+            index = numpy.array(rows)
+            widths = numpy.frombuffer(self.widths, dtype=numpy.int32)
+            widths[index] = numpy.maximum(widths[index] + dw, minimum)
+            del widths
+        else:
+            for row in rows:
+                self.widths[row] = max(self.widths[row] + dw, minimum)
+        for element, row, width in zip(resized, rows, old):
+            if self.widths[row] != width:
+                for observer in self.observers:
+                    observer.element_changed(element, "width", width)
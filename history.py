@@ -0,0 +1,163 @@
+from collections import deque
+from contextlib import contextmanager
+
+# Rough cost of one recorded change, used to enforce the memory cap.
+DELTA_BYTES = 100
+ELEMENT_BYTES = 300
+
+
+class History:
+    # Undo/redo stacks for the Edit menu. Entries hold only what changed:
+    # (element, attribute, old, new) for moves, resizes and property edits,
+    # the element and the one drawn just above it for creations and
+    # deletions, so it goes back to the same place in the drawing order, and
+    # (elements, dy, dx) for a bulk move of a selection. Changes are picked
+    # up through the element observer interface; everything reported between
+    # begin() and the matching end() (for example a whole drag, from button
+    # press to release) becomes one entry, with repeated changes of the same
+    # attribute merged into a single delta. Undoing or redoing an entry
+    # touches only its own elements, so it costs the same for any layout
+    # size. The oldest entries are dropped once the estimated size of the
+    # history exceeds max_bytes.
+    MAX_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, elements, max_bytes=MAX_BYTES):
+        self.elements = elements
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+        self.depth = 0
+        self.entry = None      # deltas of the entry being recorded
+        self.sets = None       # (element, name) -> index into entry, for merging
+        self.applying = False  # ignore notifications caused by undo/redo or untracked()
+
+    def begin(self):
+        if self.depth == 0:
+            self.entry = []
+            self.sets = {}
+        self.depth += 1
+
+    def end(self):
+        if self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0 and self.entry:
+            self._push(self.undo_stack, self.entry)
+            for entry in self.redo_stack:
+                self.size -= self._cost(entry)
+            self.redo_stack = []
+            self.entry = None
+
+    def _record(self, delta):
+        if self.applying:
+            return
+        if self.depth == 0:
+            self.begin()
+            self._record(delta)
+            self.end()
+            return
+        self.entry.append(delta)
+
+    def _cost(self, entry):
+        cost = 0
+        for delta in entry:
+            if delta[0] == "set":
+                cost += DELTA_BYTES + (len(delta[3]) + len(delta[4]) if delta[2] == "text" else 0)
+            elif delta[0] == "translate":
+                cost += DELTA_BYTES + 8 * len(delta[1])
+            else:
+                cost += ELEMENT_BYTES + len(delta[1].text)
+        return cost
+
+    def _push(self, stack, entry):
+        stack.append(entry)
+        self.size += self._cost(entry)
+        while self.size > self.max_bytes and self.undo_stack:
+            self.size -= self._cost(self.undo_stack.popleft())
+
+    @contextmanager
+    def untracked(self):
+        # Changes made inside are not undoable steps of their own, e.g. the
+        # positions constraint_layout derives from the terminal size.
+        applying, self.applying = self.applying, True
+        try:
+            yield
+        finally:
+            self.applying = applying
+
+    def undo(self):
+        if not self.undo_stack:
+            return False
+        entry = self.undo_stack.pop()
+        self._apply(entry, reverse=True)
+        self.redo_stack.append(entry)
+        return True
+
+    def redo(self):
+        if not self.redo_stack:
+            return False
+        entry = self.redo_stack.pop()
+        self._apply(entry, reverse=False)
+        self.undo_stack.append(entry)
+        return True
+
+    def _apply(self, entry, reverse):
+        self.applying = True
+        try:
+            restored = []  # (element, above) to put back in one go
+            for delta in (reversed(entry) if reverse else entry):
+                kind, element = delta[0], delta[1]
+                if kind in ("create", "delete") and (kind == "create") != reverse:
+                    if element not in self.elements:
+                        restored.append((element, delta[2]))
+                    continue
+                self._restore(restored)
+                if kind == "set":
+                    setattr(element, delta[2], delta[3] if reverse else delta[4])
+                elif kind == "translate":
+                    sign = -1 if reverse else 1
+                    self.elements.translate(element, sign * delta[2], sign * delta[3])
+                elif element in self.elements:
+                    self.elements.remove(element)
+            self._restore(restored)
+        finally:
+            self.applying = False
+
+    def _restore(self, restored):
+        # Put back the elements collected by _apply, each just below the
+        # element that was drawn above it.
+        if restored:
+            self.elements.insert_many(restored)
+            del restored[:]
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self._record(("create", element, self.elements.above.get(element)))
+
+    def element_removed(self, element):
+        self._record(("delete", element, self.elements.above.get(element)))
+
+    def elements_translated(self, elements, dy, dx):
+        if self.applying:
+            return
+        if self.depth and self.entry:
+            last = self.entry[-1]
+            if last[0] == "translate" and last[1] == elements:
+                # Successive steps of one drag become a single offset.
+                self.entry[-1] = ("translate", last[1], last[2] + dy, last[3] + dx)
+                return
+        self._record(("translate", elements, dy, dx))
+
+    def element_changed(self, element, name, old):
+        if name == "selected" or self.applying:
+            return
+        new = getattr(element, name)
+        if self.depth:
+            index = self.sets.get((element, name))
+            if index is not None:
+                self.entry[index] = ("set", element, name, self.entry[index][3], new)
+                return
+            self.sets[(element, name)] = len(self.entry)
+        self._record(("set", element, name, old, new))
@@ -0,0 +1,290 @@
+import curses
+import datetime
+import os
+import sys
+from . import screen
+from .screen import VirtualScreen, VirtualWindow
+
+# Compiles a layout into a standalone Python module for deployed TUIs.
+#
+# Every element is drawn once, at compile time, with its own draw_image()
+# into a pad that notes the calls made on it: the box around the element
+# and the labels inside. The generated module repeats them to draw the
+# whole layout into one pad, the size of its bounding box, the first time
+# render() is called: each element's box is copied from a pad boxed by
+# curses itself, so borders use its ACS_* characters, and its labels are
+# added on top. Every render() then copies the layout pad onto the window
+# with one overwrite() per rectangle of a cover of the drawn cells, in
+# which neighbouring elements on the same rows share a rectangle; that is
+# never more calls than the element count, which is what the designer's
+# render cache makes. The module imports nothing but curses, so a
+# deployed program neither parses layout.json nor builds element objects.
+#
+#   python -m visual_curses.layout_compiler [LAYOUT] OUTPUT.py
+
+
+class GlyphScreen(VirtualScreen):
+    # Draws borders with the box-drawing characters curses shows for ACS_*,
+    # for the plain-text snapshots flatten() makes.
+    ACS_VLINE = "│"
+    ACS_HLINE = "─"
+    ACS_ULCORNER = "┌"
+    ACS_URCORNER = "┐"
+    ACS_LLCORNER = "└"
+    ACS_LRCORNER = "┘"
+
+
+class RecordingPad(VirtualWindow):
+    # In-memory pad that also notes the drawing calls made on it: whether
+    # it was boxed, and (row, column, text, attr) of every addstr().
+    def __init__(self, screen, height, width):
+        super().__init__(screen, height, width, pad=True)
+        self.boxed = False
+        self.labels = []
+
+    def box(self, vertch=0, horch=0):
+        if vertch or horch:
+            raise ValueError("only the default box can be compiled")
+        super().box()
+        self.boxed = True
+
+    def addstr(self, y, x, text, attr=0):
+        self.labels.append((y, x, text, attr))
+        super().addstr(y, x, text, attr)
+
+
+def flatten(elements):
+    # Stack the element images into (top, left, chars, attrs), where chars
+    # and attrs are row lists covering the layout's bounding box and None
+    # marks cells no element covers. The second cell of a wide character
+    # holds "".
+    glyphs = GlyphScreen(1, 1)
+    rects = [element.bounds() for element in elements]
+    if not rects:
+        return 0, 0, [], []
+    top = min(rect[0] for rect in rects)
+    left = min(rect[1] for rect in rects)
+    height = max(rect[0] + rect[2] for rect in rects) - top
+    width = max(rect[1] + rect[3] for rect in rects) - left
+    chars = [[None] * width for _row in range(height)]
+    attrs = [[None] * width for _row in range(height)]
+    images = {}
+    # The images come from the element classes' own drawing code, which asks
+    # the screen module for colour pairs; answer from the in-memory screen so
+    # this works with or without a terminal.
+    previous = screen.backend
+    screen.use(glyphs)
+    try:
+        for element, (y, x, h, w) in zip(elements, rects):
+            key = element.render_key()
+            pad = images.get(key)
+            if pad is None:
+                pad = images[key] = VirtualWindow(glyphs, h, w, pad=True)
+                pad.bkgd(" ", glyphs.color_pair(1))
+                element.draw_image(pad)
+            for row in range(h):
+                chars[y - top + row][x - left:x - left + w] = pad.chars[row]
+                attrs[y - top + row][x - left:x - left + w] = pad.attrs[row]
+    finally:
+        screen.use(previous)
+    return top, left, chars, attrs
+
+
+def cover(rects):
+    # (y, x, height, width) rectangles covering exactly the cells of rects:
+    # the stretches of covered cells on each row, with equal stretches on
+    # consecutive rows joined into one rectangle. The rects themselves when
+    # that is no more.
+    rows = {}
+    for y, x, height, width in rects:
+        for row in range(y, y + height):
+            rows.setdefault(row, []).append((x, x + width))
+    result = []
+    open_rects = {}  # (start, end) -> first row of a stretch still open
+    last = None
+    for row in sorted(rows):
+        stretches = []
+        for start, end in sorted(rows[row]):
+            if stretches and start <= stretches[-1][1]:
+                stretches[-1] = (stretches[-1][0], max(end, stretches[-1][1]))
+            else:
+                stretches.append((start, end))
+        continued = set(stretches) if last == row - 1 else set()
+        for stretch, first in list(open_rects.items()):
+            if stretch not in continued:
+                result.append((first, stretch[0], last + 1 - first, stretch[1] - stretch[0]))
+                del open_rects[stretch]
+        for stretch in stretches:
+            open_rects.setdefault(stretch, row)
+        last = row
+    for stretch, first in open_rects.items():
+        result.append((first, stretch[0], last + 1 - first, stretch[1] - stretch[0]))
+    result.sort()
+    return result if len(result) <= len(rects) else list(rects)
+
+
+def record(elements):
+    # (row, column, height, width, boxed, labels) of each element's image,
+    # relative to the layout's top-left cell, with the attrs of its labels.
+    glyphs = VirtualScreen(1, 1)
+    rects = [element.bounds() for element in elements]
+    top = min((rect[0] for rect in rects), default=0)
+    left = min((rect[1] for rect in rects), default=0)
+    images = []
+    previous = screen.backend
+    screen.use(glyphs)  # The drawing code asks the screen module for colour pairs.
+    try:
+        for element, (y, x, height, width) in zip(elements, rects):
+            pad = RecordingPad(glyphs, height, width)
+            try:
+                element.draw_image(pad)
+            except curses.error:
+                pass
+            images.append((y - top, x - left, height, width, pad.boxed, pad.labels))
+    finally:
+        screen.use(previous)
+    return top, left, images
+
+
+def compile_items(items, source="the designer"):
+    # Source code of a module that renders the layout given as element dicts.
+    from .ui_manager import UIManager
+    elements = [UIManager.element_from_dict(item) for item in items]
+    for element in elements:
+        element.selected = False  # Selection is editor state, not part of the design.
+    top, left, images = record(elements)
+    styles = []
+    style_index = {}
+    lines = []
+    for row, column, height, width, boxed, labels in images:
+        compiled = []
+        for label_row, label_column, text, attr in labels:
+            style = (attr & curses.A_COLOR) >> 8, attr & ~(curses.A_COLOR | curses.A_CHARTEXT)
+            index = style_index.get(style)
+            if index is None:
+                index = style_index[style] = len(styles)
+                styles.append(style)
+            compiled.append((label_row, label_column, text, index))
+        lines.append(f"    ({row}, {column}, {height}, {width}, {boxed}, {tuple(compiled)!r}),\n")
+    rects = cover([image[:4] for image in images])
+    stamp = datetime.datetime.now().isoformat(timespec="seconds")
+    elements_table = "".join(
+        f"    ({element.id}, {element.__class__.__name__!r}, {element.y}, {element.x}, "
+        f"{element.width}, {element.text!r}),\n" for element in elements)
+    return MODULE_TEMPLATE.format(
+        source=source, stamp=stamp, count=len(elements), top=top, left=left,
+        height=max((image[0] + image[2] for image in images), default=0),
+        width=max((image[1] + image[3] for image in images), default=0),
+        styles="".join(f"    ({pair}, {flags}),\n" for pair, flags in styles),
+        elements="".join(elements_table), images="".join(lines),
+        cover="".join(f"    {rect!r},\n" for rect in rects))
+
+
+def export_layout(items, path, source="the designer"):
+    # Compile and write the module, replacing any previous export at once.
+    code = compile_items(items, source)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(code)
+    os.replace(tmp_path, path)
+    return code.count("\n")
+
+
+MODULE_TEMPLATE = '''# Generated by visual_curses.layout_compiler from {source} on {stamp}.
+# Do not edit: re-export the layout instead. With this module imported as
+# `layout`, inside curses.wrapper():
+#
+#   layout.init_colors()
+#   layout.render(stdscr)
+import curses
+
+ELEMENT_COUNT = {count}
+TOP = {top}  # canvas position of the layout's top-left cell
+LEFT = {left}
+HEIGHT = {height}
+WIDTH = {width}
+
+# (colour pair, other attribute bits) used by the labels.
+STYLES = (
+{styles})
+
+# (id, type, y, x, width, text) of each element, in drawing order.
+ELEMENTS = (
+{elements})
+
+# (row, column, height, width, boxed, labels) of each element's image in
+# drawing order, relative to TOP/LEFT: its rectangle, whether it has a box
+# around it, and (row, column, text, style) of each label inside it.
+IMAGES = (
+{images})
+
+# (row, column, height, width) rectangles covering every drawn cell,
+# relative to TOP/LEFT; one overwrite() each.
+COVER = (
+{cover})
+
+PADS = {{}}  # (window background, screen) -> pad with the layout drawn in it
+
+
+def init_colors():
+    # The colour pairs the designer draws with.
+    curses.start_color()
+    curses.use_default_colors()
+    curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
+    curses.init_pair(2, curses.COLOR_WHITE, curses.COLOR_BLUE)
+    curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_CYAN)
+
+
+def draw(background, screen):
+    # A pad holding the whole layout, drawn as the designer draws it.
+    pad = screen.newpad(HEIGHT + 1, WIDTH + 1)  # Room past the last cell for the cursor.
+    pad.bkgd(background)
+    attrs = [screen.color_pair(pair) | flags for pair, flags in STYLES]
+    frames = {{}}  # (height, width, boxed) -> blank pad of that size, boxed or not
+    for row, column, height, width, boxed, labels in IMAGES:
+        frame = frames.get((height, width, boxed))
+        if frame is None:
+            frame = frames[(height, width, boxed)] = screen.newpad(height, width)
+            frame.bkgd(background)
+            if boxed:
+                frame.box()
+        frame.overwrite(pad, 0, 0, row, column, row + height - 1, column + width - 1)
+        for label_row, label_column, text, style in labels:
+            try:
+                pad.addstr(row + label_row, column + label_column, text, attrs[style])
+            except curses.error:
+                pass
+    return pad
+
+
+def render(win, y=TOP, x=LEFT, screen=curses):
+    # Draw the layout with its top-left cell at window position (y, x); by
+    # default everything appears where it was designed. `screen` provides
+    # newpad(), color_pair() and the ACS_* characters: curses, or a stand-in
+    # for windows that are not curses windows. The layout is drawn into a
+    # pad the first time; after that, each call only copies the pad.
+    key = (win.getbkgd(), screen)
+    pad = PADS.get(key)
+    if pad is None:
+        pad = PADS[key] = draw(*key)
+    max_y, max_x = win.getmaxyx()
+    for row, column, height, width in COVER:
+        # Clipped to the window; overwrite() rejects off-window targets.
+        top, left = max(y + row, 0), max(x + column, 0)
+        bottom, right = min(y + row + height, max_y) - 1, min(x + column + width, max_x) - 1
+        if top <= bottom and left <= right:
+            pad.overwrite(win, top - y, left - x, top, left, bottom, right)
+'''
+
+
+if __name__ == "__main__":
+    from .ui_manager import UIManager
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python -m visual_curses.layout_compiler [LAYOUT] OUTPUT.py\n"
+                 "Compiles a layout (the saved layout and journal by default) into a module.")
+    if len(sys.argv) == 3:
+        layout_items, layout_source = UIManager.iter_snapshot(sys.argv[1]), sys.argv[1]
+    else:
+        layout_items, layout_source = UIManager.load_items(), UIManager.LAYOUT_FILE
+    line_count = export_layout(layout_items, sys.argv[-1], layout_source)
+    print(f"wrote {sys.argv[-1]} ({line_count} lines)")
@@ -0,0 +1,107 @@
+import array
+import json
+import mmap
+import struct
+import sys
+
+# Compact binary layout format.
+#
+#   header   MAGIC, version, element count, string count
+#   records  one fixed-width RECORD per element, in drawing order
+#   offsets  string count + 1 little-endian uint32 offsets into the blob
+#   blob     UTF-8 bytes of every distinct string
+#
+# Type names and texts are stored once in the string table and referenced by
+# index. Properties beyond the common ones (e.g. Checkbox "checked") are kept
+# as a JSON object in the string table, so any registered element type
+# round-trips. The file is memory-mapped and decoded one record at a time;
+# only the fixed-width record and offset tables are copied out of the map.
+MAGIC = b"VCL1"
+VERSION = 1
+HEADER = struct.Struct("<4sHII")
+# id, y, x, width, type string, text string, extra-properties string
+RECORD = struct.Struct("<IiiiIII")
+OFFSET = struct.Struct("<I")
+NO_STRING = 0xFFFFFFFF
+COMMON_KEYS = ("type", "id", "y", "x", "width", "text")
+
+
+def is_binary_layout(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_items(items, f):
+    strings = {}
+
+    def intern(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    records = bytearray()
+    count = 0
+    for item in items:
+        extra = dict((key, value) for key, value in item.items() if key not in COMMON_KEYS)
+        records += RECORD.pack(
+            item["id"], item["y"], item["x"], item["width"],
+            intern(item["type"]), intern(item["text"]),
+            intern(json.dumps(extra, separators=(",", ":"), sort_keys=True)) if extra else NO_STRING,
+        )
+        count += 1
+    f.write(HEADER.pack(MAGIC, VERSION, count, len(strings)))
+    f.write(records)
+    encoded = [value.encode("utf-8") for value in strings]
+    offset = 0
+    for data in encoded:
+        f.write(OFFSET.pack(offset))
+        offset += len(data)
+    f.write(OFFSET.pack(offset))
+    for data in encoded:
+        f.write(data)
+
+
+def iter_items(path):
+    # Yield the layout's element dicts one by one from a memory map.
+    with open(path, "rb") as f:
+        try:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Empty file.
+    with view:
+        magic, version, count, string_count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} binary layout")
+        offsets_at = HEADER.size + count * RECORD.size
+        blob_at = offsets_at + (string_count + 1) * OFFSET.size
+        offsets = array.array("I", view[offsets_at:blob_at])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        type_names = {}  # Type names and extras repeat a lot; decode them once.
+        extras = {}
+
+        def string(index):
+            return str(view[blob_at + offsets[index]:blob_at + offsets[index + 1]], "utf-8")
+
+        for element_id, y, x, width, type_index, text_index, extra_index in RECORD.iter_unpack(
+                view[HEADER.size:offsets_at]):
+            type_name = type_names.get(type_index)
+            if type_name is None:
+                type_name = type_names[type_index] = string(type_index)
+            item = {"type": type_name, "id": element_id, "y": y, "x": x, "width": width,
+                    "text": string(text_index)}
+            if extra_index != NO_STRING:
+                extra = extras.get(extra_index)
+                if extra is None:
+                    extra = extras[extra_index] = json.loads(string(extra_index))
+                item.update(extra)
+            yield item
+
+
+if __name__ == "__main__":
+    from .ui_manager import UIManager
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m visual_curses.layout_format SOURCE TARGET\n"
+                 "Converts between layout.json and binary (*.vcl) layouts.")
+    UIManager.convert_layout(sys.argv[1], sys.argv[2])
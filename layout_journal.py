@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from .ui_manager import UIManager
+
+
+class LayoutJournal:
+    # Records every create/move/resize/edit/delete on the canvas as one small
+    # JSON line appended to UIManager.JOURNAL_FILE, so saving never rewrites
+    # the whole layout on the UI thread. Compaction rotates the journal aside
+    # and folds it into the snapshot on a background thread; load_layout()
+    # replays snapshot + rotated journal + live journal on startup. Bulk
+    # deletes and moves of a selection are one record listing the ids. An
+    # element put back under another one, e.g. by undoing its deletion, is
+    # created with the id of the element drawn just above it.
+    # Records hold resulting values, never deltas, so replaying a journal
+    # that a cut-short compaction already folded in changes nothing.
+    COMPACT_AFTER = 10000  # Records appended before compacting on our own.
+
+    def __init__(self, path=None, elements=None):
+        self.path = path or UIManager.JOURNAL_FILE
+        self.elements = elements  # ElementStore journaled, for its `above`
+        self.file = open(self.path, "a")
+        self.records = 0
+        self.unsynced = 0  # Records appended since the last sync or flush.
+        self.compactor = None
+
+    def append(self, op, **record):
+        record["op"] = op
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.records += 1
+        self.unsynced += 1
+        if self.records >= self.COMPACT_AFTER:
+            self.compact()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def flush(self):
+        # Hand the buffered records to the OS and return a duplicate of the
+        # journal's descriptor, for an fsync on another thread that stays
+        # valid if the journal is rotated meanwhile. The caller closes it.
+        self.file.flush()
+        self.unsynced = 0
+        return os.dup(self.file.fileno())
+
+    def save(self):
+        # Make every recorded edit durable, then compact in the background.
+        self.sync()
+        self.compact()
+
+    def compact(self):
+        if self.compactor and self.compactor.is_alive():
+            return
+        rotated = self.path + ".1"
+        # A leftover rotated journal means an earlier compaction was cut
+        # short; fold that one in first and rotate on a later call.
+        if not os.path.exists(rotated):
+            self.file.close()
+            os.replace(self.path, rotated)
+            self.file = open(self.path, "a")
+            self.records = 0
+        self.compactor = threading.Thread(target=UIManager.compact_layout, args=(rotated,), daemon=True)
+        self.compactor.start()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        if self.compactor:
+            self.compactor.join()
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        above = self.elements.above.get(element) if self.elements is not None else None
+        if above is None:
+            self.append("create", element=element.to_dict())
+        else:
+            self.append("create", element=element.to_dict(), above=above.id)
+
+    def element_removed(self, element):
+        self.append("delete", id=element.id)
+
+    def elements_removed(self, elements):
+        self.append("delete", ids=[element.id for element in elements])
+
+    def elements_translated(self, elements, dy, dx):
+        self.append("move", ids=[element.id for element in elements],
+                    ys=[element.y for element in elements], xs=[element.x for element in elements])
+
+    def element_changed(self, element, name, old):
+        if name in ("y", "x"):
+            self.append("move", id=element.id, fields={"y": element.y, "x": element.x})
+        elif name == "width":
+            self.append("resize", id=element.id, fields={"width": element.width})
+        elif name in ("text", "constraints"):
+            fields = element.to_dict()
+            for key in ("type", "id", "y", "x", "width"):
+                del fields[key]
+            fields["constraints"] = element.constraints  # None when they were cleared
+            self.append("edit", id=element.id, fields=fields)
@@ -0,0 +1,73 @@
+from .toolbar_manager import ToolbarManager
+
+# Layout checks run from the UI (Option-L) and on save. Every element is
+# checked against the terminal size the layout is meant for: it must not
+# leave the screen, cover the menu bar, log line or left toolbar or run under
+# the right properties panel, and it must not overlap another element.
+#
+# Overlaps come from ElementStore.overlaps(), a sweep line over the bounding
+# boxes that runs in O(n log n) instead of comparing every pair.
+
+# Kinds of problem, with how they are described.
+OUTSIDE = "outside"  # not entirely on the screen
+CHROME = "chrome"    # on the menu bar or the log line
+TOOLBAR = "toolbar"  # on the left toolbar
+PANEL = "panel"      # under the right properties panel
+OVERLAP = "overlap"  # overlapping another element
+MESSAGES = {OUTSIDE: "is not on the screen", CHROME: "covers the menu bar or the log line",
+            TOOLBAR: "covers the left toolbar", PANEL: "runs under the properties panel",
+            OVERLAP: "overlaps element {other.id}"}
+
+
+def lint(elements, size):
+    # (element, kind, other) for the problems of the elements (an
+    # ElementStore) on a terminal of size (lines, columns), in drawing
+    # order. `other` is the element overlapped for OVERLAP, otherwise None.
+    lines, columns = size
+    canvas = ToolbarManager.canvas_rect(lines, columns)
+    toolbar_right = ToolbarManager.left_toolbar_rect(lines)[3]
+    panel_left = ToolbarManager.right_toolbar_rect(lines, columns)[1]
+    # element -> kinds of problem with its position
+    misplaced = dict.fromkeys(elements.outside((0, 0, lines, columns)), (OUTSIDE,))
+    for element in elements.outside(canvas):
+        if element in misplaced:
+            continue
+        y, x, height, width = element.bounds()
+        kinds = []
+        if y < canvas[0] or y + height > canvas[0] + canvas[2]:
+            kinds.append(CHROME)
+        if x < toolbar_right:
+            kinds.append(TOOLBAR)
+        if x + width > panel_left:
+            kinds.append(PANEL)
+        misplaced[element] = kinds
+    overlapping = elements.overlaps()
+    problems = []
+    if misplaced or overlapping:
+        append = problems.append
+        for element in elements:
+            kinds = misplaced.get(element)
+            if kinds:
+                for kind in kinds:
+                    append((element, kind, None))
+            other = overlapping.get(element)
+            if other is not None:
+                append((element, OVERLAP, other))
+    return problems
+
+
+def describe(problem):
+    # A problem as text, e.g. "Element 12 overlaps element 40".
+    element, kind, other = problem
+    return f"Element {element.id} " + MESSAGES[kind].format(other=other)
+
+
+def summary(problems):
+    # One line counting the problems by kind, e.g. "3 problems: 2 overlap, 1 toolbar".
+    if not problems:
+        return "no problems"
+    counts = {}
+    for _element, kind, _other in problems:
+        counts[kind] = counts.get(kind, 0) + 1
+    details = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+    return f"{len(problems)} problem{'s' if len(problems) != 1 else ''}: {details}"
@@ -0,0 +1,41 @@
+import os
+from .ui_manager import UIManager, stat_signature
+
+
+class LayoutWatcher:
+    # Notices when another program rewrites a layout file by polling its
+    # stat signature (inode, size, modification time), so no inotify or
+    # other platform dependency is needed. A new signature is reported once
+    # it has held for two polls in a row, so a file that is still being
+    # written is not read half-way. Snapshots this process wrote itself
+    # (UIManager.write_snapshot, e.g. journal compaction) are not reported.
+    INTERVAL = 1.0  # Seconds between polls.
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or UIManager.LAYOUT_FILE)
+        self.seen = self.signature()  # version the canvas was loaded from
+        self.candidate = None         # changed version waiting to settle
+
+    def signature(self):
+        try:
+            return stat_signature(os.stat(self.path))
+        except OSError:
+            return None
+
+    def poll(self):
+        # True when the file has changed since it was last seen or reported.
+        # A missing file is not a change: the canvas is kept as it is.
+        signature = self.signature()
+        if signature is None or signature == self.seen:
+            self.candidate = None
+            return False
+        if signature == UIManager.own_writes.get(self.path):
+            self.seen = signature
+            self.candidate = None
+            return False
+        if signature != self.candidate:
+            self.candidate = signature
+            return False
+        self.seen = signature
+        self.candidate = None
+        return True
@@ -0,0 +1,96 @@
+import struct
+import time
+
+
+class Macro:
+    # A recorded stream of input events, stored as packed fixed-width records
+    # in a bytearray: milliseconds since recording started, key code, mouse
+    # button state and mouse position. The same bytes are written to disk
+    # after a small header.
+    MAGIC = b"VCM1"
+    HEADER = struct.Struct("<4sI")
+    EVENT = struct.Struct("<IiIhh")
+    NO_MOUSE = -32768  # mx of a key event without mouse data
+
+    def __init__(self):
+        self.data = bytearray()
+        self.started = None
+
+    def __len__(self):
+        return len(self.data) // self.EVENT.size
+
+    def start(self):
+        self.data = bytearray()
+        self.started = time.monotonic()
+
+    def record(self, key, mouse):
+        ms = int((time.monotonic() - self.started) * 1000)
+        if mouse:
+            bstate, mx, my = mouse
+            self.data += self.EVENT.pack(ms, key, bstate, mx, my)
+        else:
+            self.data += self.EVENT.pack(ms, key, 0, self.NO_MOUSE, 0)
+
+    def truncate(self, count):
+        del self.data[count * self.EVENT.size:]
+
+    def events(self):
+        # (seconds, key, mouse) for every event, mouse as in Application.read_events.
+        for ms, key, bstate, mx, my in self.EVENT.iter_unpack(self.data):
+            yield ms / 1000.0, key, None if mx == self.NO_MOUSE else (bstate, mx, my)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(self)))
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path):
+        macro = cls()
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < cls.HEADER.size:
+            raise ValueError(f"{path}: not a macro file")
+        magic, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{path}: not a macro file")
+        if len(data) - cls.HEADER.size != count * cls.EVENT.size:
+            raise ValueError(f"{path}: truncated or corrupt macro file")
+        macro.data = bytearray(data[cls.HEADER.size:])
+        return macro
+
+
+class MacroPlayer:
+    # Replays a macro from the main loop. speed 1.0 keeps the recorded
+    # timing, other positive values scale it and 0 plays every event at once.
+    def __init__(self, macro, speed=1.0, iterations=1):
+        self.events = list(macro.events())
+        self.speed = speed
+        self.iterations = iterations
+        self.position = 0
+        self.started = time.monotonic()
+
+    @property
+    def done(self):
+        return self.iterations <= 0 or not self.events
+
+    def next_due(self):
+        # Monotonic time at which the next event is due.
+        if self.done:
+            return None
+        if not self.speed:
+            return self.started
+        return self.started + self.events[self.position][0] / self.speed
+
+    def due(self, now):
+        # Pop the (key, mouse) events whose time has come.
+        ready = []
+        while not self.done and self.next_due() <= now:
+            _seconds, key, mouse = self.events[self.position]
+            ready.append((key, mouse))
+            self.position += 1
+            if self.position == len(self.events):
+                self.position = 0
+                self.iterations -= 1
+                self.started = now
+        return ready
@@ -1,95 +1,209 @@
 import curses
+from . import screen
+from .constraint_layout import constraints_text, parse_constraints
+from .text_layout import display_width, truncate
 
-class PopupManager:
-    @staticmethod
-    def edit_properties(stdscr, selected_element):
-        if not selected_element:
-            return
-        curses.echo()
-        max_y, max_x = stdscr.getmaxyx()
-        height, width = 10, 40
-        begin_y = max_y // 2 - height // 2
-        begin_x = max_x // 2 - width // 2
-        win = curses.newwin(height, width, begin_y, begin_x)
-        win.box()
-        win.addstr(1, 2, "Edit Properties", curses.A_BOLD)
-        # Prompt for new text.
-        prompt = f"Text [{selected_element.text}]: "
-        win.addstr(3, 2, prompt)
-        win.refresh()
-        new_text = win.getstr(3, 2 + len(prompt)).decode("utf-8")
-        if new_text.strip():
-            selected_element.text = new_text
-
-        # Prompt for new width.
-        prompt = f"Width [{selected_element.width}]: "
-        win.addstr(4, 2, prompt)
-        win.refresh()
-        new_width_str = win.getstr(4, 2 + len(prompt)).decode("utf-8")
-        if new_width_str.strip():
-            try:
-                selected_element.width = max(5, int(new_width_str))
-            except:
-                pass
+# Mouse events that dismiss a popup. Releases and motion reports don't: the
+# click that opened the popup is still being released when it appears.
+DISMISS_BUTTONS = curses.BUTTON1_PRESSED | curses.BUTTON2_PRESSED | curses.BUTTON3_PRESSED
 
-        # Prompt for new X.
-        prompt = f"X [{selected_element.x}]: "
-        win.addstr(5, 2, prompt)
-        win.refresh()
-        new_x_str = win.getstr(5, 2 + len(prompt)).decode("utf-8")
-        if new_x_str.strip():
-            try:
-                selected_element.x = int(new_x_str)
-            except:
-                pass
 
-        # Prompt for new Y.
-        prompt = f"Y [{selected_element.y}]: "
-        win.addstr(6, 2, prompt)
-        win.refresh()
-        new_y_str = win.getstr(6, 2 + len(prompt)).decode("utf-8")
-        if new_y_str.strip():
-            try:
-                selected_element.y = int(new_y_str)
-            except:
-                pass
+class Popup:
+    # Modal message box centred on the screen. While it is open the
+    # application hands it every input event instead of running a nested
+    # getch() loop; any key or click closes it.
+    def __init__(self, lines, style=0, size=None, message=" - Popup closed"):
+        self.lines = lines      # (text, attr) per row inside the border
+        self.style = style      # background and border attributes
+        self.size = size or (len(lines) + 2, max(display_width(text) for text, _attr in lines) + 4)
+        self.message = message  # logged when the popup is closed
+
+    def rect(self, max_y, max_x):
+        height, width = self.size
+        return (max_y // 2 - height // 2, max_x // 2 - width // 2, height, width)
+
+    def state(self):
+        return None
+
+    def draw(self, win, rect):
+        PopupManager.draw_frame(win, rect, self.style)
+        for i, (text, attr) in enumerate(self.lines):
+            PopupManager.draw_text(win, rect, i + 1, 2, text, self.style | attr)
+
+    def handle(self, key, mouse):
+        # Returns the log message once the event closes the popup.
+        if mouse and not mouse[0] & DISMISS_BUTTONS:
+            return None
+        return self.message
+
+
+class PropertyEditor:
+    # Modal form for the text, width and position of the selected elements.
+    # Typed characters go to the highlighted field; Enter moves to the next
+    # one and applies the form after the last, so the changes are one undo
+    # step. A filled-in field is set on every element; an empty field keeps
+    # each element's own value. The current values shown are those of the
+    # last element, the primary selection. Escape closes without changes.
+    # Anchors takes constraints as constraint_layout.parse_constraints()
+    # reads them, e.g. "x=right y=below:12 width=50%", or "none".
+    FIELDS = (("Text", "text"), ("Width", "width"), ("X", "x"), ("Y", "y"), ("Anchors", "constraints"))
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.values = [""] * len(self.FIELDS)
+        self.field = 0
+
+    def rect(self, max_y, max_x):
+        height, width = 10, 56
+        return (max_y // 2 - height // 2, max_x // 2 - width // 2, height, width)
+
+    def state(self):
+        return (self.field, tuple(self.values))
+
+    def draw(self, win, rect):
+        PopupManager.draw_frame(win, rect, 0)
+        title = "Edit Properties"
+        if len(self.elements) > 1:
+            title += f" ({len(self.elements)} elements)"
+        PopupManager.draw_text(win, rect, 1, 2, title, curses.A_BOLD)
+        primary = self.elements[-1]
+        for i, (label, name) in enumerate(self.FIELDS):
+            current = constraints_text(primary.constraints) if name == "constraints" else getattr(primary, name)
+            line = f"{label} [{current}]: {self.values[i]}"
+            if i == self.field:
+                PopupManager.draw_text(win, rect, 3 + i, 2, line + "_", curses.A_BOLD)
+            else:
+                PopupManager.draw_text(win, rect, 3 + i, 2, line, 0)
+        PopupManager.draw_text(win, rect, 8, 2, "Enter: next field  Esc: cancel", 0)
 
-        curses.noecho()
-        win.getch()  # Wait for one final key
-        del win
+    def handle(self, key, mouse):
+        # Returns the log message once the event closes the editor.
+        if 32 <= key < 127:
+            self.values[self.field] += chr(key)
+        elif key in (curses.KEY_BACKSPACE, 127, 8):
+            self.values[self.field] = self.values[self.field][:-1]
+        elif key in (10, 13, curses.KEY_ENTER):
+            self.field += 1
+            if self.field == len(self.FIELDS):
+                return self.apply()
+        elif key == 27:  # Escape
+            return " - Edit cancelled"
+        return None
+
+    def apply(self):
+        # Sets the filled-in fields and returns the log message, naming the
+        # fields left unchanged because their value could not be read.
+        message = " - Properties updated"
+        text = self.values[0]
+        if text.strip():
+            for element in self.elements:
+                element.text = text
+        for (label, name), value in zip(self.FIELDS[1:], self.values[1:]):
+            if value.strip() and name == "constraints":
+                try:
+                    parse_constraints(value)
+                except ValueError as e:
+                    message += f" - {label} not changed: {e}"
+                    continue
+                for element in self.elements:
+                    element.constraints = parse_constraints(value)  # a dict of its own each
+            elif value.strip():
+                try:
+                    number = int(value)
+                except ValueError:
+                    message += f" - {label} not changed: {value.strip()!r} is not a number"
+                    continue
+                for element in self.elements:
+                    setattr(element, name, max(5, number) if name == "width" else number)
+        return message
+
+
+class PopupManager:
+    # Builds the modal states the application shows above the canvas (see
+    # Application.modal) and draws their frames.
 
     @staticmethod
-    def show_help_popup(stdscr):
+    def edit_properties(selected_elements):
+        # Property editor for the selected elements, or None without any.
+        if not selected_elements:
+            return None
+        return PropertyEditor(selected_elements)
+
+    @staticmethod
+    def help_popup():
         # Centered help popup listing hotkeys.
         help_lines = [
             "Hotkeys:",
             "Option-Q: Quit",
             "Option-S: Save",
             "Option-H: Show Help",
-            "e: Edit Properties (of selected control)",
+            "Option-P: Profiler overlay",
+            "PgUp/PgDn, Shift-Arrows, Wheel: Scroll canvas",
+            "Home: Scroll canvas back to the origin",
+            "e: Edit Properties (of selected controls)",
+            "  Anchors (follow resizes): x=left|right|center|align:ID|after:ID",
+            "  y=top|bottom|center|align:ID|below:ID  width=N%|match:ID  or none",
             "Mouse Left-Click: Select/Drag/Resize",
+            "Left-Drag on empty canvas: Select a rectangle",
+            "Shift-Click: Add to or remove from the selection",
+            "Option-A: Select all, Esc: Select none",
+            "Arrows: Move selected controls",
+            "Dragging snaps to nearby element edges",
+            "Option-G: Toggle snapping",
+            "Option-L: Check the layout for overlaps and off-screen controls",
             "Mouse Right-Click: Select for Properties",
             "File Menu: Click 'File' then 'Save'",
-            "Delete Control: Click to delete selected control",
-            "Elements Menu: Lists current elements",
+            "File > Export: Compile the layout to layout_view.py",
+            "Delete Control: Click to delete selected controls",
+            "Elements Menu: Type to filter (#id for an id), Up/Down/Enter to select",
             "",
             "Click or press any key to close..."
         ]
-        max_y, max_x = stdscr.getmaxyx()
-        height = len(help_lines) + 2
-        width = max(len(line) for line in help_lines) + 4
-        begin_y = max_y // 2 - height // 2
-        begin_x = max_x // 2 - width // 2
-        popup = curses.newwin(height, width, begin_y, begin_x)
-        popup.bkgd(' ', curses.color_pair(2))
-        popup.box()
-        for i, line in enumerate(help_lines):
+        return Popup([(line, 0) for line in help_lines], screen.color_pair(2), message=" - Help closed")
+
+    @staticmethod
+    def lint_popup(summary, descriptions, more=0):
+        # Popup with the result of a layout check (see layout_lint): the
+        # summary line, some of the problems and how many more there are.
+        lines = [(f"Layout check: {summary}", curses.A_BOLD), ("", 0)]
+        lines += [(description, 0) for description in descriptions]
+        if more:
+            lines.append((f"... and {more} more", 0))
+        lines += [("", 0), ("Click or press any key to close...", 0)]
+        return Popup(lines, screen.color_pair(2), message=" - Layout check closed")
+
+    @staticmethod
+    def draw_frame(win, rect, style):
+        # Blank a popup's rectangle and draw its border, clipped to the window.
+        y, x, height, width = rect
+        max_y, max_x = win.getmaxyx()
+        left, right = max(x, 0), min(x + width, max_x)
+        for row in range(max(y, 0), min(y + height, max_y)):
+            try:
+                win.addstr(row, left, " " * (right - left), style)
+            except curses.error:
+                pass  # The window's bottom-right cell.
+        bottom, last = y + height - 1, x + width - 1
+        for row, column, ch in ((y, x, screen.ACS_ULCORNER), (y, last, screen.ACS_URCORNER),
+                                (bottom, x, screen.ACS_LLCORNER), (bottom, last, screen.ACS_LRCORNER)):
+            try:
+                win.addch(row, column, ch, style)
+            except curses.error:
+                pass
+        for row, column, ch, length, line in ((y, x + 1, screen.ACS_HLINE, width - 2, win.hline),
+                                              (bottom, x + 1, screen.ACS_HLINE, width - 2, win.hline),
+                                              (y + 1, x, screen.ACS_VLINE, height - 2, win.vline),
+                                              (y + 1, last, screen.ACS_VLINE, height - 2, win.vline)):
             try:
-                popup.addstr(i + 1, 2, line, curses.color_pair(2))
+                line(row, column, ch | style, length)
             except curses.error:
                 pass
-        popup.refresh()
-        popup.nodelay(0)
-        popup.keypad(1)
-        popup.getch()
-        del popup
\ No newline at end of file
+
+    @staticmethod
+    def draw_text(win, rect, row, column, text, attr):
+        # Write a line inside a popup, cut at its right border.
+        y, x, _height, width = rect
+        try:
+            win.addstr(y + row, x + column, truncate(text, max(width - column - 1, 0)), attr)
+        except curses.error:
+            pass
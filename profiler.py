@@ -0,0 +1,103 @@
+import datetime
+import json
+import time
+from collections import deque
+
+
+class PhaseTimer:
+    __slots__ = ("profiler", "phase", "start")
+
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.phase, time.perf_counter() - self.start)
+
+
+class NullTimer:
+    # Handed out while profiling is off, so a timed block costs one method
+    # call and an empty with statement.
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class FrameProfiler:
+    # Per-phase timings of each frame. Code wraps a phase in
+    # `with profiler.timer(name):`; the time of every phase that ran during
+    # a frame is summed and, at end_frame(), appended to a rolling window of
+    # the last `window` frames, from which percentiles are computed on
+    # demand. Phases in PHASES order are what the overlay and export show.
+    PHASES = ("events", "top_toolbar", "left_toolbar", "elements", "right_panel", "log_line",
+              "overlays", "damage", "refresh", "frame")
+    WINDOW = 600
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.overlay = False
+        self.samples = dict((phase, deque(maxlen=window)) for phase in self.PHASES)
+        self.current = {}
+        self.frames = 0
+
+    def timer(self, phase):
+        if not self.enabled:
+            return NULL_TIMER
+        return PhaseTimer(self, phase)
+
+    def add(self, phase, seconds):
+        self.current[phase] = self.current.get(phase, 0.0) + seconds
+
+    def end_frame(self):
+        if not self.current:
+            return
+        for phase, seconds in self.current.items():
+            self.samples[phase].append(seconds)
+        self.current = {}
+        self.frames += 1
+
+    def toggle_overlay(self):
+        # Showing the overlay turns profiling on; it then keeps collecting
+        # for the export when the overlay is hidden again.
+        self.overlay = not self.overlay
+        self.enabled = True
+
+    def summary(self):
+        # phase -> (samples, p50, p95, p99, max) in milliseconds, for phases
+        # that have run at least once.
+        result = {}
+        for phase in self.PHASES:
+            samples = sorted(self.samples[phase])
+            if not samples:
+                continue
+            last = len(samples) - 1
+            result[phase] = (len(samples),) + tuple(
+                samples[min(last, len(samples) * p // 100)] * 1000 for p in self.PERCENTILES
+            ) + (samples[last] * 1000,)
+        return result
+
+    def overlay_lines(self):
+        lines = [f"{'phase':<12} {'p50':>7} {'p95':>7} {'p99':>7} ms"]
+        for phase, (_count, p50, p95, p99, _max) in self.summary().items():
+            lines.append(f"{phase:<12} {p50:>7.2f} {p95:>7.2f} {p99:>7.2f}")
+        return lines
+
+    def export(self, path):
+        # Append one JSON line per phase with its percentiles.
+        stamp = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(path, "a") as f:
+            for phase, (count, p50, p95, p99, worst) in self.summary().items():
+                f.write(json.dumps({"time": stamp, "phase": phase, "frames": count,
+                                    "p50_ms": round(p50, 4), "p95_ms": round(p95, 4),
+                                    "p99_ms": round(p99, 4), "max_ms": round(worst, 4)}) + "\n")
@@ -0,0 +1,56 @@
+import curses
+from collections import OrderedDict
+from . import screen
+
+
+class RenderCache:
+    # Bounded LRU of pre-rendered element images. Elements that look the same
+    # (same class, width, text and selection state) share one off-screen pad,
+    # which is drawn once and then copied onto the target window with a single
+    # overwrite() call instead of one addch per border cell.
+    MAX_IMAGES = 512
+
+    def __init__(self, max_images=MAX_IMAGES):
+        self.max_images = max_images
+        self.images = OrderedDict()
+
+    def __len__(self):
+        return len(self.images)
+
+    def clear(self):
+        self.images.clear()
+
+    def image(self, element, win):
+        bkgd = win.getbkgd()
+        key = element.render_key() + (bkgd,)
+        pad = self.images.get(key)
+        if pad is not None:
+            self.images.move_to_end(key)
+            return pad
+        height, width = element.bounds()[2:]
+        pad = screen.newpad(height, width)
+        pad.bkgd(bkgd)
+        element.draw_image(pad)
+        self.images[key] = pad
+        if len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+        return pad
+
+    def blit(self, element, win, origin=(0, 0), clip=None):
+        y, x, height, width = element.bounds()
+        y, x = y - origin[0], x - origin[1]
+        max_y, max_x = win.getmaxyx()
+        # Clip the image to the window; overwrite() rejects off-window targets.
+        top, left = max(y, 0), max(x, 0)
+        bottom, right = min(y + height, max_y) - 1, min(x + width, max_x) - 1
+        if clip:
+            clip_y, clip_x = clip[0] - origin[0], clip[1] - origin[1]
+            top, left = max(top, clip_y), max(left, clip_x)
+            bottom, right = min(bottom, clip_y + clip[2] - 1), min(right, clip_x + clip[3] - 1)
+        if top > bottom or left > right:
+            return
+        pad = self.image(element, win)
+        try:
+            pad.overwrite(win, top - y, left - x, top, left, bottom, right)
+        except curses.error:
+            pass
@@ -0,0 +1,310 @@
+import curses
+from . import screen
+from .profiler import FrameProfiler
+from .toolbar_manager import ToolbarManager
+
+
+def intersects(a, b):
+    # Whether two (y, x, height, width) rectangles share at least one cell.
+    return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+            a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+
+def intersection(a, b):
+    # The rectangle two rectangles have in common, or None.
+    top, left = max(a[0], b[0]), max(a[1], b[1])
+    bottom, right = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if top >= bottom or left >= right:
+        return None
+    return (top, left, bottom - top, right - left)
+
+
+# Repaints only the screen regions that changed since the last frame.
+# The canvas elements are drawn into an off-screen pad the size of the canvas
+# area between the toolbars, which shows the viewport: the canvas rectangle
+# starting at the app's scroll offset. Only elements intersecting the
+# viewport are ever drawn, each clipped to the damaged canvas rectangle, so a
+# frame costs what is visible rather than what is in the layout.
+# The screen is a z-ordered stack of opaque rectangular layers: chrome (menu
+# bar, side panels), the canvas, then the dropdowns, rubber band, alignment
+# guides, crosshair, log line, profiler and the modal popup, if one is open.
+# Like the canvas, every other layer is drawn into an off-screen buffer of
+# its own, and only when its state changes. The screen is composited from
+# the buffers: each dirty rectangle is erased, then the part of every layer
+# inside it is copied over it bottom to top, so opening or closing a menu or
+# popup repaints just the cells it covers without redrawing the layers under
+# it. Dirty rectangles come from repainted canvas areas and from layers that
+# appeared, disappeared or changed; everything is flushed with a single
+# noutrefresh/doupdate.
+class Renderer:
+    # Profiler phase each layer's drawing time is counted under.
+    LAYER_PHASES = {"menu_bar": "top_toolbar", "file": "top_toolbar", "edit": "top_toolbar",
+                    "macros": "top_toolbar", "elements": "top_toolbar", "left": "left_toolbar",
+                    "right": "right_panel", "log": "log_line", "crosshair": "overlays",
+                    "profile": "overlays", "modal": "overlays", "band_top": "overlays",
+                    "band_bottom": "overlays", "band_left": "overlays", "band_right": "overlays",
+                    "guide_row": "overlays", "guide_column": "overlays"}
+
+    def __init__(self, win, index, profiler=None):
+        self.win = win
+        self.index = index  # SpatialIndex over the canvas elements
+        self.profiler = profiler or FrameProfiler()
+        self.size = None
+        self.full = True
+        self.dirty = []         # screen rectangles to repaint
+        self.canvas_dirty = []  # canvas rectangles to repaint in the pad
+        self.changed = set()    # elements to repaint at their current bounds
+        self.drawn = {}         # element -> canvas rectangle it was last painted at
+        self.chrome = {}        # layer name -> (rect, state) of the last frame
+        self.buffers = {}       # layer name -> off-screen window it is drawn in
+        self.pad = None
+        self.view = None        # canvas rectangle held by the pad
+
+    def invalidate_all(self):
+        self.full = True
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self.changed.add(element)
+
+    def element_removed(self, element):
+        self.changed.discard(element)
+        rect = self.drawn.pop(element, None)
+        if rect:
+            self.canvas_dirty.append(rect)
+
+    def element_changed(self, element, name, old):
+        rect = self.drawn.get(element)
+        if rect:
+            self.canvas_dirty.append(rect)
+        self.changed.add(element)
+
+    def chrome_layers(self, app, max_y, max_x):
+        # (name, rect, state, draw) for every chrome layer below the canvas;
+        # draw(win) paints the layer into a screen-sized window.
+        layers = [("menu_bar", (0, 0, 1, max_x), None, ToolbarManager.draw_menu_bar)]
+        layers.append(("left", ToolbarManager.left_toolbar_rect(max_y), None,
+                       lambda win: ToolbarManager.draw_left_toolbar(win, app.left_toolbar)))
+        selected = app.selected_element
+        count = len(app.selection)
+        props = None
+        if selected:
+            props = (selected.__class__, selected.x, selected.y, selected.width, selected.text, count)
+        layers.append(("right", ToolbarManager.right_toolbar_rect(max_y, max_x), props,
+                       lambda win: ToolbarManager.draw_right_toolbar(win, selected, max_x, count)))
+        return layers
+
+    def overlay_layers(self, app, max_y, max_x):
+        # (name, rect, state, draw) for the layers painted above the canvas.
+        layers = []
+        for name, is_open in (("file", app.file_menu_open), ("edit", app.edit_menu_open),
+                              ("macros", app.macros_menu_open)):
+            if is_open:
+                layers.append((name, ToolbarManager.menu_rect(name), None,
+                               lambda win, name=name: ToolbarManager.draw_menu(win, name)))
+        if app.elements_menu_open:
+            matches = app.element_search.search(app.elements_menu_query)
+            state = (app.elements_menu_query, app.elements_menu_scroll, app.elements_menu_cursor,
+                     app.element_search.version)
+            layers.append(("elements", ToolbarManager.elements_menu_rect(len(matches), max_y, max_x), state,
+                           lambda win: ToolbarManager.draw_elements_menu(win, matches, app.elements_menu_query,
+                                                                     app.elements_menu_scroll,
+                                                                     app.elements_menu_cursor)))
+        canvas = ToolbarManager.canvas_rect(max_y, max_x)
+        if app.band:
+            # The rubber band outline, as one layer per side.
+            y, x, height, width = app.band_rect()
+            y, x = y - app.scroll_y, x - app.scroll_x
+            for name, side in (("band_top", (y, x, 1, width)), ("band_bottom", (y + height - 1, x, 1, width)),
+                               ("band_left", (y, x, height, 1)), ("band_right", (y, x + width - 1, height, 1))):
+                rect = intersection(side, canvas)
+                if rect:
+                    layers.append((name, rect, None,
+                                   lambda win, rect=rect: self.draw_line(win, rect, screen.color_pair(3))))
+        for kind, value in app.guides:
+            # A line across the canvas area at the row or column lined up with.
+            if kind == "row":
+                rect = intersection((value - app.scroll_y, canvas[1], 1, canvas[3]), canvas)
+            else:
+                rect = intersection((canvas[0], value - app.scroll_x, canvas[2], 1), canvas)
+            if rect:
+                layers.append(("guide_" + kind, rect, None,
+                               lambda win, rect=rect: self.draw_line(win, rect, screen.color_pair(2))))
+        if 0 <= app.crosshair_y < max_y and 0 <= app.crosshair_x < max_x:
+            layers.append(("crosshair", (app.crosshair_y, app.crosshair_x, 1, 1), None,
+                           lambda win: self.draw_crosshair(win, app)))
+        layers.append(("log", (max_y - 1, 0, 1, max_x), app.log_message,
+                       lambda win: self.draw_log(win, app, max_y, max_x)))
+        if self.profiler.overlay:
+            lines = self.profiler.overlay_lines()
+            width = max(len(line) for line in lines)
+            rect = (max(max_y - 1 - len(lines), 1), max(max_x - 27 - width, 0), len(lines), width)
+            layers.append(("profile", rect, tuple(lines), lambda win: self.draw_profile(win, rect, lines)))
+        modal = app.modal
+        if modal:
+            # A popup or the property editor, above everything else.
+            modal_rect = modal.rect(max_y, max_x)
+            layers.append(("modal", modal_rect, (modal, modal.state()),
+                           lambda win: modal.draw(win, modal_rect)))
+        return layers
+
+    def draw_crosshair(self, win, app):
+        try:
+            win.addch(app.crosshair_y, app.crosshair_x, ord('+'), screen.color_pair(3))
+        except curses.error:
+            pass
+
+    def draw_line(self, win, rect, style):
+        # A rubber band side or an alignment guide: a line one cell thick.
+        y, x, height, width = rect
+        try:
+            if height == 1:
+                win.hline(y, x, screen.ACS_HLINE | style, width)
+            else:
+                win.vline(y, x, screen.ACS_VLINE | style, height)
+        except curses.error:
+            pass
+
+    def draw_log(self, win, app, max_y, max_x):
+        try:
+            win.addstr(max_y - 1, 0, "Log: " + app.log_message[:max_x - 5], screen.color_pair(1))
+        except curses.error:
+            pass
+
+    def draw_profile(self, win, rect, lines):
+        y, x, _height, width = rect
+        for i, line in enumerate(lines):
+            try:
+                win.addstr(y + i, x, line.ljust(width), screen.color_pair(2))
+            except curses.error:
+                pass
+
+    def render(self, app):
+        with self.profiler.timer("frame"):
+            self.paint(app)
+        self.profiler.end_frame()
+
+    def paint(self, app):
+        profiler = self.profiler
+        max_y, max_x = self.win.getmaxyx()
+        canvas = ToolbarManager.canvas_rect(max_y, max_x)
+        view = (canvas[0] + app.scroll_y, canvas[1] + app.scroll_x, canvas[2], canvas[3])
+        below = self.chrome_layers(app, max_y, max_x)
+        above = self.overlay_layers(app, max_y, max_x)
+        if (max_y, max_x) != self.size:
+            self.size = (max_y, max_x)
+            self.pad = screen.newpad(canvas[2], canvas[3])
+            self.buffers = {}
+            self.full = True
+        if self.full or view != self.view:
+            # The pad is repainted from scratch for a new viewport.
+            self.view = view
+            self.canvas_dirty = [view]
+            self.drawn = {}
+            if self.pad.getbkgd() != self.win.getbkgd():
+                self.pad.bkgd(self.win.getbkgd())
+
+        with profiler.timer("elements"):
+            for element in self.changed:
+                self.canvas_dirty.append(element.bounds())
+            for rect in self.canvas_dirty:
+                rect = intersection(rect, view)
+                if rect:
+                    self.paint_canvas(rect)
+                    self.dirty.append((rect[0] - app.scroll_y, rect[1] - app.scroll_x, rect[2], rect[3]))
+            self.canvas_dirty = []
+            self.changed.clear()
+
+        # Layers that appeared or changed are redrawn in their buffers; the
+        # cells they cover now and covered before are dirty.
+        current = {}
+        for name, rect, state, draw in below + above:
+            current[name] = (rect, state)
+            last = self.chrome.get(name)
+            if self.full or last != (rect, state):
+                with profiler.timer(self.LAYER_PHASES[name]):
+                    self.draw_layer(name, rect, draw, max_y, max_x)
+                self.dirty.append(rect)
+                if last and last[0] != rect:
+                    self.dirty.append(last[0])
+        for name, (rect, _state) in self.chrome.items():
+            if name not in current:
+                self.dirty.append(rect)
+        self.chrome = current
+        if self.full:
+            self.dirty = [(0, 0, max_y, max_x)]
+        if not self.dirty:
+            return
+
+        with profiler.timer("damage"):
+            self.composite(below, canvas, above, max_y, max_x)
+        self.dirty = []
+        self.full = False
+        with profiler.timer("refresh"):
+            self.win.noutrefresh()
+            screen.doupdate()
+
+    def draw_layer(self, name, rect, draw, max_y, max_x):
+        # Redraw a layer in its buffer, a screen-sized pad, so the layer's
+        # drawing code can keep using screen coordinates.
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = screen.newpad(max_y, max_x)
+            buffer.bkgd(self.win.getbkgd())
+        self.erase(buffer, rect, max_y, max_x)
+        draw(buffer)
+
+    def composite(self, below, canvas, above, max_y, max_x):
+        # Erase every dirty rectangle on the screen and copy the part of
+        # each layer inside it over it, bottom to top.
+        for rect in self.dirty:
+            rect = intersection(rect, (0, 0, max_y, max_x))
+            if not rect:
+                continue
+            self.erase(self.win, rect, max_y, max_x)
+            for name, layer_rect, _state, _draw in below:
+                self.copy(self.buffers[name], layer_rect, rect, 0, 0)
+            self.copy(self.pad, canvas, rect, canvas[0], canvas[1])
+            for name, layer_rect, _state, _draw in above:
+                self.copy(self.buffers[name], layer_rect, rect, 0, 0)
+
+    def copy(self, source, layer_rect, rect, top, left):
+        # Copy the cells of a layer inside a screen rectangle from the
+        # window it is drawn in, whose top-left cell is at (top, left).
+        rect = intersection(layer_rect, rect)
+        if rect:
+            y, x, height, width = rect
+            try:
+                source.overwrite(self.win, y - top, x - left, y, x, y + height - 1, x + width - 1)
+            except curses.error:
+                pass
+
+    def erase(self, win, rect, max_y, max_x):
+        y, x, height, width = rect
+        top, left = max(y, 0), max(x, 0)
+        bottom, right = min(y + height, max_y), min(x + width, max_x)
+        if left >= right:
+            return
+        blank = " " * (right - left)
+        for row in range(top, bottom):
+            try:
+                win.addstr(row, left, blank)
+            except curses.error:
+                pass  # The bottom-right cell.
+
+    def paint_canvas(self, rect):
+        # Erase a canvas rectangle inside the viewport in the pad and redraw
+        # the elements overlapping it, back-to-front and clipped to it.
+        top, left = self.view[0], self.view[1]
+        y, x, height, width = rect
+        blank = " " * width
+        for row in range(y - top, y - top + height):
+            try:
+                self.pad.addstr(row, x - left, blank)
+            except curses.error:
+                pass  # The pad's bottom-right cell.
+        origin = (top, left)
+        for element in self.index.query_rect(rect):
+            element.draw(self.pad, origin, rect)
+            self.drawn[element] = element.bounds()
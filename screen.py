@@ -0,0 +1,338 @@
+import curses
+from collections import deque
+from .text_layout import cells
+
+# The screen backend used by all drawing code. Window methods are called on
+# whatever window object is passed in, but the module-level calls that need a
+# terminal (color_pair, newwin, newpad, doupdate, ACS_* characters, mouse and
+# echo setup) go through this module, e.g. screen.color_pair(1). By default
+# they reach curses; use(VirtualScreen(...)) routes them to an in-memory
+# screen instead, so the whole UI can run without a terminal.
+# Plain constants (A_BOLD, BUTTON1_PRESSED, KEY_MOUSE, curses.error, ...) are
+# the same for every backend and are still taken from curses.
+backend = curses
+
+
+def use(new_backend):
+    global backend
+    backend = new_backend
+    return new_backend
+
+
+def __getattr__(name):
+    return getattr(backend, name)
+
+
+class VirtualWindow:
+    # A curses window backed by a cell buffer: one list of characters and
+    # one list of attributes per row. Implements the window calls this
+    # project makes, with curses' clipping, wrapping and error behaviour.
+    def __init__(self, screen, height, width, begin_y=0, begin_x=0, pad=False):
+        self.screen = screen
+        self.height, self.width = height, width
+        self.begin_y, self.begin_x = begin_y, begin_x
+        self.pad = pad
+        self.background = (" ", 0)
+        self.attr = 0
+        self.delay = -1
+        self.chars = [[" "] * width for _row in range(height)]
+        self.attrs = [[0] * width for _row in range(height)]
+        self.touched = set(range(height))  # rows changed since the last refresh
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def getbegyx(self):
+        return self.begin_y, self.begin_x
+
+    def rendition(self, attr):
+        attr |= self.attr
+        if not attr & curses.A_COLOR:
+            attr |= self.background[1] & curses.A_COLOR
+        return attr
+
+    def check(self, y, x):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise curses.error("position outside the window")
+
+    def put(self, y, x, text, attr):
+        # Write text at (y, x), wrapping at the right edge. As in curses, it
+        # is an error to run past the last cell or to end on it.
+        self.check(y, x)
+        attr = self.rendition(attr)
+        for line_number, line in enumerate(text.split("\n")):
+            if line_number:
+                self.chars[y][x:] = [self.background[0]] * (self.width - x)
+                self.attrs[y][x:] = [self.background[1]] * (self.width - x)
+                self.touched.add(y)
+                y, x = y + 1, 0
+                if y == self.height:
+                    raise curses.error("write past the end of the window")
+            if not line.isascii():
+                line = cells(line)  # One entry per cell, as wide characters take two.
+            while line:
+                count = min(len(line), self.width - x)
+                self.chars[y][x:x + count] = line[:count]
+                self.attrs[y][x:x + count] = [attr] * count
+                self.touched.add(y)
+                line = line[count:]
+                x += count
+                if x == self.width:
+                    y, x = y + 1, 0
+                    if y == self.height:
+                        raise curses.error("write past the end of the window")
+
+    def addstr(self, *args):
+        # addstr([y, x,] text[, attr]); the cursor position is not tracked,
+        # so the short forms write at the top-left corner.
+        if len(args) >= 3:
+            y, x, text = args[:3]
+            attr = args[3] if len(args) > 3 else 0
+        else:
+            y, x, text = 0, 0, args[0]
+            attr = args[1] if len(args) > 1 else 0
+        self.put(y, x, text, attr)
+
+    def addch(self, y, x, ch, attr=0):
+        if isinstance(ch, int):
+            attr |= ch & ~curses.A_CHARTEXT
+            ch = chr(ch & curses.A_CHARTEXT)
+        self.put(y, x, ch, attr)
+
+    def vline(self, y, x, ch, n):
+        self.check(y, x)
+        for row in range(y, min(y + n, self.height)):
+            self.cell(row, x, ch)
+
+    def hline(self, y, x, ch, n):
+        self.check(y, x)
+        for column in range(x, min(x + n, self.width)):
+            self.cell(y, column, ch)
+
+    def cell(self, y, x, ch, attr=0):
+        # Set one cell without moving any cursor; never an error.
+        if isinstance(ch, int):
+            attr |= ch & ~curses.A_CHARTEXT
+            ch = chr(ch & curses.A_CHARTEXT)
+        self.chars[y][x] = ch
+        self.attrs[y][x] = self.rendition(attr)
+        self.touched.add(y)
+
+    def box(self, vertch=0, horch=0):
+        screen = self.screen
+        vertch = vertch or screen.ACS_VLINE
+        horch = horch or screen.ACS_HLINE
+        bottom, right = self.height - 1, self.width - 1
+        for x in range(1, right):
+            self.cell(0, x, horch)
+            self.cell(bottom, x, horch)
+        for y in range(1, bottom):
+            self.cell(y, 0, vertch)
+            self.cell(y, right, vertch)
+        self.cell(0, 0, screen.ACS_ULCORNER)
+        self.cell(0, right, screen.ACS_URCORNER)
+        self.cell(bottom, 0, screen.ACS_LLCORNER)
+        self.cell(bottom, right, screen.ACS_LRCORNER)
+
+    def attron(self, attr):
+        self.attr |= attr
+
+    def attroff(self, attr):
+        self.attr &= ~attr
+
+    def attrset(self, attr):
+        self.attr = attr
+
+    def bkgd(self, ch, attr=0):
+        # Cells showing the old background take the new one; other cells
+        # drawn in the old background colour take the new colour.
+        if isinstance(ch, int):
+            attr |= ch & ~curses.A_CHARTEXT
+            ch = chr(ch & curses.A_CHARTEXT)
+        old_ch, old_attr = self.background
+        old_color, color = old_attr & curses.A_COLOR, attr & curses.A_COLOR
+        for row, (chars, attrs) in enumerate(zip(self.chars, self.attrs)):
+            if chars.count(old_ch) == self.width and attrs.count(old_attr) == self.width:
+                self.chars[row], self.attrs[row] = [ch] * self.width, [attr] * self.width  # Background only.
+                continue
+            for x, cell_attr in enumerate(attrs):
+                if chars[x] == old_ch and cell_attr == old_attr:
+                    chars[x], attrs[x] = ch, attr
+                elif cell_attr & curses.A_COLOR == old_color:
+                    attrs[x] = cell_attr & ~curses.A_COLOR | color
+        self.background = (ch, attr)
+        self.touchwin()
+
+    def getbkgd(self):
+        return ord(self.background[0]) | self.background[1]
+
+    def erase(self):
+        ch, attr = self.background
+        self.chars = [[ch] * self.width for _row in range(self.height)]
+        self.attrs = [[attr] * self.width for _row in range(self.height)]
+        self.touchwin()
+
+    clear = erase
+
+    def resize(self, height, width):
+        # Cut or extend the cell buffer; new cells show the background.
+        ch, attr = self.background
+        self.chars = [(row + [ch] * width)[:width] for row in self.chars[:height]]
+        self.attrs = [(row + [attr] * width)[:width] for row in self.attrs[:height]]
+        self.chars += [[ch] * width for _row in range(height - len(self.chars))]
+        self.attrs += [[attr] * width for _row in range(height - len(self.attrs))]
+        self.height, self.width = height, width
+        self.touchwin()
+
+    def overwrite(self, dest, sminrow, smincol, dminrow, dmincol, dmaxrow, dmaxcol):
+        if not (0 <= dminrow <= dmaxrow < dest.height and 0 <= dmincol <= dmaxcol < dest.width):
+            raise curses.error("overwrite target outside the window")
+        count = dmaxcol - dmincol + 1
+        for offset in range(dmaxrow - dminrow + 1):
+            source_row = sminrow + offset
+            if source_row >= self.height:
+                break
+            row = dminrow + offset
+            dest.chars[row][dmincol:dmincol + count] = self.chars[source_row][smincol:smincol + count]
+            dest.attrs[row][dmincol:dmincol + count] = self.attrs[source_row][smincol:smincol + count]
+            dest.touched.add(row)
+
+    def touchwin(self):
+        self.touched.update(range(self.height))
+
+    def noutrefresh(self, *pad_args):
+        # Copy the changed rows to the screen. Pads take curses' six
+        # arguments (pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol).
+        if self.pad:
+            pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol = pad_args
+            rows = range(pminrow, min(pminrow + smaxrow - sminrow + 1, self.height))
+            top, left = sminrow - pminrow, smincol - pmincol
+            columns = slice(pmincol, min(pmincol + smaxcol - smincol + 1, self.width))
+        else:
+            rows = sorted(self.touched)
+            top, left = self.begin_y, self.begin_x
+            columns = slice(0, self.width)
+        self.screen.copy(self, rows, columns, top, left)
+        self.touched.clear()
+
+    def refresh(self, *pad_args):
+        self.noutrefresh(*pad_args)
+        self.screen.doupdate()
+
+    def timeout(self, delay):
+        self.delay = delay
+
+    def nodelay(self, flag):
+        self.delay = 0 if flag else -1
+
+    def keypad(self, flag):
+        pass
+
+    def getch(self):
+        # Next queued key; -1 once the queue is empty, whatever the timeout,
+        # since nothing else could ever arrive.
+        return self.screen.keys.popleft() if self.screen.keys else -1
+
+    def getstr(self, *position):
+        data = bytearray()
+        key = self.getch()
+        while key not in (-1, 10, 13):
+            data.append(key & 0xFF)
+            key = self.getch()
+        return bytes(data)
+
+
+class VirtualScreen:
+    # In-memory terminal that stands in for the curses module (see use()).
+    # `stdscr` is its full-screen window; input is queued with push_key()
+    # and push_mouse() and drained through getch()/getmouse(); refreshed
+    # windows are composed into `chars`/`attrs`, which text() returns as the
+    # lines a terminal would show.
+    ACS_VLINE = ord("|")
+    ACS_HLINE = ord("-")
+    ACS_ULCORNER = ACS_URCORNER = ACS_LLCORNER = ACS_LRCORNER = ord("+")
+
+    def __init__(self, lines=24, cols=80):
+        self.LINES, self.COLS = lines, cols
+        self.chars = [[" "] * cols for _row in range(lines)]
+        self.attrs = [[0] * cols for _row in range(lines)]
+        self.keys = deque()
+        self.mouse = deque()
+        self.pairs = {}
+        self.updates = 0
+        self.stdscr = VirtualWindow(self, lines, cols)
+
+    def push_key(self, key):
+        self.keys.append(key if isinstance(key, int) else ord(key))
+
+    def push_mouse(self, bstate, mx, my):
+        self.keys.append(curses.KEY_MOUSE)
+        self.mouse.append((0, mx, my, 0, bstate))
+
+    def copy(self, win, rows, columns, top, left):
+        for row in rows:
+            y = top + row
+            if not 0 <= y < self.LINES:
+                continue
+            start = left + columns.start
+            chars = win.chars[row][columns]
+            attrs = win.attrs[row][columns]
+            if start < 0:
+                chars, attrs, start = chars[-start:], attrs[-start:], 0
+            end = min(start + len(chars), self.COLS)
+            self.chars[y][start:end] = chars[:end - start]
+            self.attrs[y][start:end] = attrs[:end - start]
+
+    def text(self):
+        return ["".join(row) for row in self.chars]
+
+    # Module-level curses functions.
+
+    def newwin(self, height, width, begin_y=0, begin_x=0):
+        return VirtualWindow(self, height, width, begin_y, begin_x)
+
+    def resizeterm(self, lines, cols):
+        # The terminal changed size: stdscr follows it. Report it to the
+        # application with push_key(curses.KEY_RESIZE).
+        self.LINES, self.COLS = lines, cols
+        self.chars = [[" "] * cols for _row in range(lines)]
+        self.attrs = [[0] * cols for _row in range(lines)]
+        self.stdscr.resize(lines, cols)
+
+    def newpad(self, height, width):
+        return VirtualWindow(self, height, width, pad=True)
+
+    def doupdate(self):
+        self.updates += 1
+
+    def color_pair(self, number):
+        return number << 8 & curses.A_COLOR
+
+    def init_pair(self, number, foreground, background):
+        self.pairs[number] = (foreground, background)
+
+    def getmouse(self):
+        if not self.mouse:
+            raise curses.error("no mouse event queued")
+        return self.mouse.popleft()
+
+    def mousemask(self, mask):
+        return mask, 0
+
+    def curs_set(self, visibility):
+        return 0
+
+    def start_color(self):
+        pass
+
+    def use_default_colors(self):
+        pass
+
+    def echo(self):
+        pass
+
+    def noecho(self):
+        pass
+
+    def set_escdelay(self, ms):
+        pass
@@ -0,0 +1,70 @@
+class Selection:
+    # The selected canvas elements, in the order they were selected. Members
+    # have their `selected` flag set, so the renderer highlights them, and
+    # the selection is an element observer so that deleted elements drop
+    # out of it. The element selected last is the primary one: the
+    # properties panel shows it and single-element actions apply to it.
+    def __init__(self):
+        self.members = {}  # element -> None; a dict keeps the selection order
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(list(self.members))
+
+    def __contains__(self, element):
+        return element in self.members
+
+    @property
+    def primary(self):
+        if not self.members:
+            return None
+        return next(reversed(self.members))
+
+    def add(self, element):
+        # Select an element, or make an already selected one the primary.
+        if element in self.members:
+            del self.members[element]
+        else:
+            element.selected = True
+        self.members[element] = None
+
+    def discard(self, element):
+        if element in self.members:
+            del self.members[element]
+            element.selected = False
+
+    def toggle(self, element):
+        if element in self.members:
+            self.discard(element)
+        else:
+            self.add(element)
+
+    def clear(self):
+        for element in self.members:
+            element.selected = False
+        self.members = {}
+
+    def set(self, elements):
+        # Replace the selection; elements already selected stay selected
+        # without being repainted.
+        elements = list(elements)
+        keep = set(elements)
+        for element in self.members:
+            if element not in keep:
+                element.selected = False
+        self.members = {}
+        for element in elements:
+            self.add(element)
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        pass
+
+    def element_removed(self, element):
+        self.discard(element)
+
+    def element_changed(self, element, name, old):
+        pass
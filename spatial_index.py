@@ -0,0 +1,135 @@
+class SpatialIndex:
+    # Uniform grid over element bounding boxes. Each element is filed under
+    # every grid cell its bounds() rectangle touches, so point and rectangle
+    # queries only look at the elements near the query instead of all of them.
+    CELL_HEIGHT = 4
+    CELL_WIDTH = 16
+
+    def __init__(self, elements=(), order=None):
+        self.cells = {}   # (row, col) -> set of elements
+        self.rects = {}   # element -> rectangle it is filed under
+        # Stacking order: the insertion sequence, unless `order` gives an
+        # element's place itself, e.g. its row in an ElementStore.
+        self.order = None if order else {}  # element -> insertion sequence
+        self.stacking = order or self.order.__getitem__
+        self.next_order = 0
+        for element in elements:
+            self.insert(element)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def _cells(self, rect):
+        y, x, height, width = rect
+        for row in range(y // self.CELL_HEIGHT, (y + height - 1) // self.CELL_HEIGHT + 1):
+            for col in range(x // self.CELL_WIDTH, (x + width - 1) // self.CELL_WIDTH + 1):
+                yield row, col
+
+    def insert(self, element):
+        rect = element.bounds()
+        self.rects[element] = rect
+        if self.order is not None:
+            self.order[element] = self.next_order
+            self.next_order += 1
+        for key in self._cells(rect):
+            self.cells.setdefault(key, set()).add(element)
+
+    def remove(self, element):
+        rect = self.rects.pop(element, None)
+        if rect is None:
+            return
+        if self.order is not None:
+            del self.order[element]
+        self._unfile(element, rect)
+
+    def _span(self, rect):
+        # (first row, last row, first col, last col) of the cells rect touches.
+        y, x, height, width = rect
+        return (y // self.CELL_HEIGHT, (y + height - 1) // self.CELL_HEIGHT,
+                x // self.CELL_WIDTH, (x + width - 1) // self.CELL_WIDTH)
+
+    def update(self, element):
+        old = self.rects.get(element)
+        rect = element.bounds()
+        if old is None or old == rect:
+            return
+        if self._span(old) == self._span(rect):
+            # Small moves usually stay within the same cells.
+            self.rects[element] = rect
+            return
+        self._unfile(element, old)
+        self.rects[element] = rect
+        for key in self._cells(rect):
+            self.cells.setdefault(key, set()).add(element)
+
+    def _unfile(self, element, rect):
+        for key in self._cells(rect):
+            bucket = self.cells.get(key)
+            if bucket is not None:
+                bucket.discard(element)
+                if not bucket:
+                    del self.cells[key]
+
+    def sort(self, elements):
+        # Back-to-front, the order the elements are drawn in.
+        return sorted(elements, key=self.stacking)
+
+    def query_rect(self, rect):
+        # Elements whose bounds overlap rect, back-to-front.
+        y, x, height, width = rect
+        if height <= 0 or width <= 0:
+            return []
+        found = set()
+        for key in self._cells(rect):
+            bucket = self.cells.get(key)
+            if bucket:
+                found.update(bucket)
+        hits = []
+        for element in found:
+            ey, ex, eh, ew = self.rects[element]
+            if ey < y + height and y < ey + eh and ex < x + width and x < ex + ew:
+                hits.append(element)
+        return self.sort(hits)
+
+    def query_point(self, y, x):
+        # Elements whose bounds contain the cell (y, x), back-to-front. Every
+        # class keeps its clickable areas inside bounds(), so callers apply
+        # their own is_within/is_on_resize_handle rules to these candidates.
+        bucket = self.cells.get((y // self.CELL_HEIGHT, x // self.CELL_WIDTH))
+        if not bucket:
+            return []
+        hits = []
+        for element in bucket:
+            ey, ex, eh, ew = self.rects[element]
+            if ey <= y < ey + eh and ex <= x < ex + ew:
+                hits.append(element)
+        return self.sort(hits)
+
+    # Element observer interface.
+
+    def element_added(self, element):
+        self.insert(element)
+
+    def element_removed(self, element):
+        self.remove(element)
+
+    def element_changed(self, element, name, old):
+        if name in ("y", "x", "width"):
+            self.update(element)
+
+    def elements_removed(self, elements):
+        for element in elements:
+            self.remove(element)
+
+    def elements_translated(self, elements, dy, dx):
+        rects, span = self.rects, self._span
+        for element in elements:
+            old = rects.get(element)
+            if old is None:
+                continue
+            rect = (old[0] + dy, old[1] + dx, old[2], old[3])
+            rects[element] = rect
+            if span(old) != span(rect):
+                self._unfile(element, old)
+                for key in self._cells(rect):
+                    self.cells.setdefault(key, set()).add(element)
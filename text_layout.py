@@ -0,0 +1,132 @@
+import unicodedata
+from functools import lru_cache
+
+# Text measured and cut in terminal cells rather than code points. CJK
+# characters and most emoji take two cells, combining marks, variation
+# selectors and joiners none, as curses counts them when it places text.
+# A user-perceived character (a grapheme: a letter with its accents, a
+# flag, an emoji ZWJ sequence) is never split when text is truncated.
+# Results are memoized per string in bounded LRU caches, so labels drawn
+# every frame are laid out once. Text whose characters each take one cell
+# on their own, like box drawing or most accented letters, skips the
+# grapheme split.
+
+CACHE_SIZE = 4096
+ELLIPSIS = "\u2026"
+ZWJ = "\u200d"
+LEFT, CENTER, RIGHT = "left", "center", "right"
+
+
+def joins(ch, cluster):
+    # Whether `ch` continues the grapheme `cluster` instead of starting one.
+    category = unicodedata.category(ch)
+    if category in ("Mn", "Me", "Mc", "Cf"):
+        return True  # Combining marks, variation selectors, joiners, tags.
+    code = ord(ch)
+    if unicodedata.category(cluster[0]) == "So":
+        if cluster[-1] == ZWJ and category == "So":
+            return True  # The next emoji of a ZWJ sequence.
+        if 0x1F3FB <= code <= 0x1F3FF:
+            return True  # A skin tone modifier.
+    if 0x1160 <= code <= 0x11FF:
+        return True  # Hangul vowel and final consonant jamo.
+    # The second regional indicator of a flag.
+    return len(cluster) == 1 and 0x1F1E6 <= code <= 0x1F1FF and 0x1F1E6 <= ord(cluster) <= 0x1F1FF
+
+
+def char_width(ch):
+    # Cells one code point takes, counted as curses (wcwidth) counts them.
+    if unicodedata.category(ch) in ("Mn", "Me", "Cf") or 0x1160 <= ord(ch) <= 0x11FF:
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+
+# Non-ASCII characters seen to take one cell and never join a neighbour, so
+# text made of them and ASCII has one cell per character (box drawing, most
+# accented letters). Filled in by single_cells().
+SINGLE_CELL = set()
+
+
+def single_cells(text):
+    # Whether the text takes one cell per character, without building its
+    # graphemes; looks up each distinct character once.
+    if text.isascii() or SINGLE_CELL.issuperset(text):
+        return True
+    for ch in set(text).difference(SINGLE_CELL):
+        if ch.isascii():
+            continue
+        if (char_width(ch) != 1 or unicodedata.category(ch) == "Mc"
+                or 0x1F1E6 <= ord(ch) <= 0x1F1FF):  # Regional indicators pair up into flags.
+            return False
+        SINGLE_CELL.add(ch)
+    return True
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def graphemes(text):
+    # The text as a tuple of (grapheme, width in cells).
+    clusters = []
+    for ch in text:
+        if clusters and joins(ch, clusters[-1]):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return tuple((cluster, sum(char_width(ch) for ch in cluster)) for cluster in clusters)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def display_width(text):
+    # Number of terminal cells the text takes up.
+    if single_cells(text):
+        return len(text)
+    return sum(width for _cluster, width in graphemes(text))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cells(text):
+    # The text as one string per cell it covers: a grapheme in its first
+    # cell and "" in the second cell of a wide one.
+    if single_cells(text):
+        return tuple(text)
+    result = []
+    for cluster, width in graphemes(text):
+        if width:
+            result.append(cluster)
+            result += [""] * (width - 1)
+        elif result:
+            result[-1] += cluster
+    return tuple(result)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def truncate(text, width, ellipsis=ELLIPSIS):
+    # The text cut to at most `width` cells at a grapheme boundary, ending
+    # in `ellipsis` if anything was cut off.
+    if display_width(text) <= width:
+        return text
+    room = width - display_width(ellipsis)
+    if room < 0:
+        return truncate(ellipsis, width, "")
+    if text.isascii():
+        return text[:room] + ellipsis
+    used = 0
+    kept = []
+    for cluster, cluster_width in graphemes(text):
+        if used + cluster_width > room:
+            break
+        kept.append(cluster)
+        used += cluster_width
+    return "".join(kept) + ellipsis
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def fit(text, width, align=LEFT, ellipsis=ELLIPSIS):
+    # The text truncated to `width` cells and padded with spaces to exactly
+    # that width, aligned LEFT, CENTER or RIGHT.
+    text = truncate(text, width, ellipsis)
+    space = width - display_width(text)
+    if align == RIGHT:
+        return " " * space + text
+    if align == CENTER:
+        return " " * (space // 2) + text + " " * (space - space // 2)
+    return text + " " * space
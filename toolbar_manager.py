@@ -1,73 +1,100 @@
 import curses
+from . import screen
+from .text_layout import fit
 from .ui_element import UIElement, Checkbox, TextInput, PopupButton
 
 class ToolbarManager:
+    # Dropdown column, option labels and attributes for each fixed menu.
+    MENUS = {
+        "file": (2, ["New", "Save", "Load", "Export", "Exit"], curses.A_BOLD),
+        "edit": (10, ["Undo", "Redo", "Cut", "Paste"], 0),
+        "macros": (18, ["Start/Stop", "Play Once", "Play Many", "Open Macro", "Save Macro"], 0),
+    }
+    ELEMENTS_MENU_X = 28
+
     @staticmethod
-    def draw_top_toolbar(win, file_menu_open, elements_menu_open, canvas_elements, macros_menu_open, edit_menu_open):
+    def draw_menu_bar(win):
         # Top toolbar on row 0 using blue background.
         try:
-            win.attron(curses.color_pair(2))
+            win.attron(screen.color_pair(2))
             win.addstr(0, 2, " File ")
             win.addstr(0, 10, " Edit ")
             win.addstr(0, 18, " Macros ")
             win.addstr(0, 28, " Elements ")
             win.addstr(0, 40, " Delete Control ")
             win.addstr(0, 58, " Help ")
-            win.attroff(curses.color_pair(2))
+            win.attroff(screen.color_pair(2))
         except curses.error:
             pass
 
-        if file_menu_open:
-            # Draw dropdown list for file menu above the toolbar and canvas.
-            try:
-                file_options = ["New", "Save", "Load", "Export", "Exit"]
-                for idx, option in enumerate(file_options):
-                    win.addstr(1 + idx, 2, option, curses.color_pair(2) | curses.A_BOLD)
-            except curses.error:
-                pass
+    @staticmethod
+    def draw_menu(win, name):
+        # Draw the dropdown list of a fixed menu just below the toolbar, as
+        # a solid box the width of its longest option.
+        start_x, options, attr = ToolbarManager.MENUS[name]
+        width = max(len(option) for option in options)
+        try:
+            for idx, option in enumerate(options):
+                win.addstr(1 + idx, start_x, option.ljust(width), screen.color_pair(2) | attr)
+        except curses.error:
+            pass
 
-        if edit_menu_open:
-            # Draw dropdown list for edit menu.
-            try:
-                start_x = 10
-                edit_options = ["Undo", "Redo", "Cut", "Paste"]
-                for idx, option in enumerate(edit_options):
-                    win.addstr(1 + idx, start_x, option, curses.color_pair(2))
-            except curses.error:
-                pass
+    @staticmethod
+    def draw_elements_menu(win, matches, query="", scroll=0, cursor=-1):
+        # Draw the Elements dropdown: a search line, then only the rows of
+        # `matches` that fit on screen, starting at `scroll`.
+        max_y, max_x = win.getmaxyx()
+        start_x = ToolbarManager.ELEMENTS_MENU_X
+        width = max_x - start_x
+        rows = ToolbarManager.elements_menu_rows(len(matches), max_y)
+        try:
+            header = f"Find: {query}_  ({len(matches)} elements)"
+            win.addstr(1, start_x, fit(header, width), screen.color_pair(2) | curses.A_BOLD)
+            for row, el in enumerate(matches[scroll:scroll + rows]):
+                display_str = f"{el.id}: {el.__class__.__name__} - {el.text}"
+                style = screen.color_pair(3) if scroll + row == cursor else screen.color_pair(2)
+                win.addstr(2 + row, start_x, fit(display_str, width), style)
+        except curses.error:
+            pass
 
-        if macros_menu_open:
-            # Draw dropdown list for macros menu.
-            try:
-                start_x = 18
-                macros_options = ["Start/Stop", "Play Once", "Play Many", "Open Macro", "Save Macro"]
-                for idx, option in enumerate(macros_options):
-                    win.addstr(1 + idx, start_x, option, curses.color_pair(2))
-            except curses.error:
-                pass
+    @staticmethod
+    def menu_rect(name):
+        # Screen rectangle (y, x, height, width) covered by a fixed dropdown.
+        start_x, options, _attr = ToolbarManager.MENUS[name]
+        return (1, start_x, len(options), max(len(option) for option in options))
 
-        if elements_menu_open:
-            # Draw dropdown list of current canvas elements below the "Elements" menu.
-            try:
-                start_x = 28
-                for idx, el in enumerate(canvas_elements):
-                    display_str = f"{idx}: {el.__class__.__name__} - {el.text}"
-                    win.addstr(1 + idx, start_x, display_str, curses.color_pair(2))
-            except curses.error:
-                pass
+    @staticmethod
+    def elements_menu_rows(count, max_y):
+        # Number of element rows the Elements dropdown shows at once.
+        return max(min(count, max_y - 3), 0)
 
     @staticmethod
-    def draw_left_toolbar(win):
-        # Left vertical toolbar on the left side; starting at row 2.
-        toolbar_items = [
+    def elements_menu_rect(count, max_y, max_x):
+        start_x = ToolbarManager.ELEMENTS_MENU_X
+        return (1, start_x, ToolbarManager.elements_menu_rows(count, max_y) + 1, max_x - start_x)
+
+    @staticmethod
+    def left_toolbar_items():
+        # Template elements shown in the left toolbar; clicking one creates a copy on the canvas.
+        return [
             UIElement(3, 2, 10, "[ Button ]"),
             Checkbox(7, 2, "Checkbox"),
             TextInput(11, 2, 15, "[ TextBox ]"),
             PopupButton(15, 2, 10, "[ Popup ]")
         ]
+
+    @staticmethod
+    def left_toolbar_rect(max_y):
+        return (2, 0, max(max_y - 4, 16), 21)
+
+    @staticmethod
+    def draw_left_toolbar(win, toolbar_items=None):
+        # Left vertical toolbar on the left side; starting at row 2.
+        if toolbar_items is None:
+            toolbar_items = ToolbarManager.left_toolbar_items()
         try:
-            win.addstr(2, 2, "Elements:", curses.A_BOLD | curses.color_pair(1))
-            win.vline(2, 20, curses.ACS_VLINE, curses.LINES - 4)
+            win.addstr(2, 2, "Elements:", curses.A_BOLD | screen.color_pair(1))
+            win.vline(2, 20, screen.ACS_VLINE, win.getmaxyx()[0] - 4)
         except curses.error:
             pass
         for item in toolbar_items:
@@ -75,12 +102,22 @@ class ToolbarManager:
         return toolbar_items
 
     @staticmethod
-    def draw_right_toolbar(win, selected_element, max_x):
-        # Right properties panel on the right side.
+    def right_toolbar_rect(max_y, max_x):
+        return (1, max_x - 26, max_y - 3, 26)
+
+    @staticmethod
+    def canvas_rect(max_y, max_x):
+        # Screen area between the toolbars that shows the canvas viewport.
+        return (1, 21, max(max_y - 2, 1), max(max_x - 47, 1))
+
+    @staticmethod
+    def draw_right_toolbar(win, selected_element, max_x, count=1):
+        # Right properties panel on the right side, showing the primary
+        # element of a selection of `count`.
         start_x = max_x - 25
         try:
-            win.vline(1, start_x - 1, curses.ACS_VLINE, curses.LINES - 3)
-            win.addstr(1, start_x, "Properties:", curses.A_BOLD | curses.color_pair(1))
+            win.vline(1, start_x - 1, screen.ACS_VLINE, win.getmaxyx()[0] - 3)
+            win.addstr(1, start_x, "Properties:", curses.A_BOLD | screen.color_pair(1))
         except curses.error:
             pass
         if selected_element:
@@ -91,13 +128,15 @@ class ToolbarManager:
                 f"Width: {selected_element.width}",
                 f"Text: {selected_element.text}"
             ]
+            if count > 1:
+                props.append(f"({count} selected)")
             for i, prop in enumerate(props):
                 try:
-                    win.addstr(3 + i, start_x, prop, curses.color_pair(1))
+                    win.addstr(3 + i, start_x, fit(prop, max_x - start_x), screen.color_pair(1))
                 except curses.error:
                     pass
         else:
             try:
-                win.addstr(3, start_x, "None", curses.color_pair(1))
+                win.addstr(3, start_x, "None", screen.color_pair(1))
             except curses.error:
                 pass
\ No newline at end of file
@@ -1,34 +1,103 @@
 import curses
-
+from . import screen
+from .element_store import ID, Y, X, WIDTH, FLAGS, TEXT, CONSTRAINTS, SELECTED, DRAGGING, RESIZING, CHECKED, EDITING
+from .popup_manager import Popup
+from .render_cache import RenderCache
+from .text_layout import display_width, fit
+
+# Element classes by the "type" name they are saved under in a layout.
+ELEMENT_TYPES = {}
+
+def register_element_type(cls):
+    # Class decorator that makes an element class loadable from layouts.
+    ELEMENT_TYPES[cls.__name__] = cls
+    return cls
+
+def field(index):
+    # Property over one column of the element's ElementStore row. A detached
+    # element keeps its values in the plain list held in `_row` instead.
+    def get(self):
+        store = self._store
+        if store is None:
+            return self._row[index]
+        return store.columns[index][self._row]
+
+    def set(self, value):
+        store = self._store
+        if store is None:
+            self._row[index] = value
+        else:
+            store.set(self, index, value)
+    return property(get, set)
+
+def flag(bit, name):
+    # Boolean property stored as one bit of the FLAGS column.
+    def get(self):
+        store = self._store
+        if store is None:
+            return bool(self._row[FLAGS] & bit)
+        return bool(store.flags[self._row] & bit)
+
+    def set(self, value):
+        store = self._store
+        if store is None:
+            self._row[FLAGS] = self._row[FLAGS] | bit if value else self._row[FLAGS] & ~bit
+        else:
+            store.set_flag(self, bit, name, value)
+    return property(get, set)
+
+@register_element_type
 class UIElement:
+    # Elements are views over a row of an ElementStore (see element_store).
+    __slots__ = ("_store", "_row", "__weakref__")
+    # Attributes that change how the element looks on screen. Assigning a new
+    # value to one of them is reported to the observers of the element's store.
+    WATCHED = frozenset(("y", "x", "width", "text", "selected", "constraints"))
+    # Shared off-screen images of elements, keyed by render_key().
+    image_cache = RenderCache()
+    # Next unused element id. Ids are stable: they are saved with the layout.
+    next_id = 1
+
+    id = field(ID)
+    y = field(Y)
+    x = field(X)
+    width = field(WIDTH)
+    text = field(TEXT)
+    constraints = field(CONSTRAINTS)  # see constraint_layout; None without any
+    selected = flag(SELECTED, "selected")
+    dragging = flag(DRAGGING, "dragging")
+    resizing = flag(RESIZING, "resizing")
+
     def __init__(self, y, x, width, text=""):
-        self.y = y
-        self.x = x
-        self.width = width
-        self.text = text
-        self.selected = False
-        self.dragging = False
-        self.resizing = False
-
-    def draw(self, win):
-        # Draw an outline around the element to show its boundaries.
+        self._store = None
+        self._row = [UIElement.next_id, y, x, width, 0, text, None]
+        UIElement.next_id += 1
+
+    def bounds(self):
+        # Canvas rectangle (y, x, height, width) covered by draw().
+        store, row = self._store, self._row
+        if store is None:
+            return (row[Y], row[X], 3, row[WIDTH] + 2)
+        return (store.ys[row], store.xs[row], 3, store.widths[row] + 2)
+
+    def render_key(self):
+        # Everything that determines how draw_image() renders the element.
+        return (self.__class__, self.width, self.text, self.selected)
+
+    def draw(self, win, origin=(0, 0), clip=None):
+        # Copy the cached image of the element onto the window. `origin` is
+        # the canvas position of the window's top-left cell; only the part
+        # inside the canvas rectangle `clip` is copied, if one is given.
+        self.image_cache.blit(self, win, origin, clip)
+
+    def draw_image(self, pad):
+        # Draw an outline around the element to show its boundaries, with the
+        # text on the middle row, fitted to the width in terminal cells.
+        # `pad` is exactly the size of bounds().
+        pad.box()
+        style = screen.color_pair(3) if self.selected else screen.color_pair(1)
         try:
-            # Top border
-            win.addch(self.y, self.x, curses.ACS_ULCORNER)
-            for i in range(1, self.width + 1):
-                win.addch(self.y, self.x + i, curses.ACS_HLINE)
-            win.addch(self.y, self.x + self.width + 1, curses.ACS_URCORNER)
-            # Middle row with text
-            win.addch(self.y + 1, self.x, curses.ACS_VLINE)
-            style = curses.color_pair(3) if self.selected else curses.color_pair(1)
-            display_text = self.text.ljust(self.width)
-            win.addstr(self.y + 1, self.x + 1, display_text[:self.width], style)
-            win.addch(self.y + 1, self.x + self.width + 1, curses.ACS_VLINE)
-            # Bottom border
-            win.addch(self.y + 2, self.x, curses.ACS_LLCORNER)
-            for i in range(1, self.width + 1):
-                win.addch(self.y + 2, self.x + i, curses.ACS_HLINE)
-            win.addch(self.y + 2, self.x + self.width + 1, curses.ACS_LRCORNER)
+            pad.addstr(1, 1, fit(self.text, self.width), style)
         except curses.error:
             pass
 
@@ -44,24 +113,35 @@ class UIElement:
         return False
 
     def to_dict(self):
-        return {
+        data = {
             "type": self.__class__.__name__,
+            "id": self.id,
             "y": self.y,
             "x": self.x,
             "width": self.width,
             "text": self.text
         }
+        if self.constraints:
+            data["constraints"] = self.constraints
+        return data
 
     @classmethod
     def from_dict(cls, data):
         return cls(data["y"], data["x"], data["width"], data["text"])
 
+@register_element_type
 class Checkbox(UIElement):
+    __slots__ = ()
+    checked = flag(CHECKED, "checked")
+
     def __init__(self, y, x, label, checked=False):
         text = f"[X] {label}" if checked else f"[ ] {label}"
-        super().__init__(y, x, width=len(text), text=text)
+        super().__init__(y, x, width=display_width(text), text=text)
         self.checked = checked
-        self.label = label
+
+    @property
+    def label(self):
+        return self.text[4:]  # text without the "[ ] " or "[X] "
 
     def toggle(self):
         self.checked = not self.checked
@@ -77,15 +157,18 @@ class Checkbox(UIElement):
         label = data["text"][4:]  # remove the "[ ] " or "[X] "
         return cls(data["y"], data["x"], label, checked=data.get("checked", False))
 
+@register_element_type
 class TextInput(UIElement):
+    __slots__ = ()
+    editing = flag(EDITING, "editing")
+
     def __init__(self, y, x, width, text=""):
         # A textbox is drawn with an outline and occupies 3 rows.
         super().__init__(y, x, width, text=text)
-        self.editing = False
 
-    def draw(self, win):
+    def draw(self, win, origin=(0, 0), clip=None):
         # Override to include the outline logic from the base class.
-        super().draw(win)
+        super().draw(win, origin, clip)
 
     def is_within(self, my, mx):
         # Consider the interactive area to be the middle row.
@@ -104,21 +187,16 @@ class TextInput(UIElement):
     def from_dict(cls, data):
         return cls(data["y"], data["x"], data["width"], text=data["text"])
 
+@register_element_type
 class PopupButton(UIElement):
+    __slots__ = ()
+
     def __init__(self, y, x, width, text="Popup"):
         super().__init__(y, x, width, text=text)
 
-    def show_popup(self, stdscr):
-        max_y, max_x = stdscr.getmaxyx()
-        height, width = 5, 30
-        begin_y = max_y // 2 - height // 2
-        begin_x = max_x // 2 - width // 2
-        popup = curses.newwin(height, width, begin_y, begin_x)
-        popup.box()
-        popup.addstr(2, 2, "This is a popup!", curses.A_BOLD)
-        popup.refresh()
-        popup.getch()  # Wait for any key press to dismiss
-        del popup
+    def popup(self):
+        # Modal popup shown when the button is clicked; see Application.modal.
+        return Popup([("", 0), ("This is a popup!", curses.A_BOLD)], size=(5, 30))
 
     def to_dict(self):
         return super().to_dict()
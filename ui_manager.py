@@ -1,29 +1,174 @@
 import json
 import os
-from .ui_element import UIElement, Checkbox, TextInput, PopupButton
+from . import layout_format
+from .constraint_layout import check_constraints
+from .element_store import stack_below
+from .ui_element import ELEMENT_TYPES, UIElement
+
+
+def stat_signature(stat):
+    # What tells two versions of a file apart without reading it.
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
 
 class UIManager:
     LAYOUT_FILE = "layout.json"  # Define LAYOUT_FILE here
+    # Layouts saved under this suffix use the compact binary format from
+    # layout_format; any other name is written as JSON. Loading detects the
+    # format from the file contents.
+    BINARY_SUFFIX = ".vcl"
+    # Edits made since the last compaction, one JSON record per line. While a
+    # compaction runs, the journal it is folding in is kept as JOURNAL_FILE.1.
+    JOURNAL_FILE = "layout.journal"
+    # Absolute path -> stat signature of the last snapshot this process
+    # wrote there, so the layout watcher can tell our writes from others'.
+    own_writes = {}
+
+    @staticmethod
+    def write_snapshot(items, path=None):
+        # Replace the layout atomically: a crash leaves either the old or the
+        # new file on disk, never a partially written one.
+        path = path or UIManager.LAYOUT_FILE
+        tmp_path = path + ".tmp"
+        binary = path.endswith(UIManager.BINARY_SUFFIX)
+        with open(tmp_path, "wb" if binary else "w") as f:
+            if binary:
+                layout_format.write_items(items, f)
+            else:
+                json.dump(items, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+            # Recorded before the rename, which keeps the inode and mtime,
+            # so a watcher never sees the new file before it is known.
+            UIManager.own_writes[os.path.abspath(path)] = stat_signature(os.fstat(f.fileno()))
+        os.replace(tmp_path, path)
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    @staticmethod
+    def iter_snapshot(path=None):
+        # Element dicts of a saved layout. Binary layouts are streamed
+        # straight from a memory map instead of being parsed up front.
+        path = path or UIManager.LAYOUT_FILE
+        if not os.path.exists(path):
+            return iter(())
+        if layout_format.is_binary_layout(path):
+            return layout_format.iter_items(path)
+        return iter(UIManager.load_snapshot(path))
+
+    @staticmethod
+    def load_snapshot(path=None):
+        path = path or UIManager.LAYOUT_FILE
+        items = []
+        if os.path.exists(path):
+            if layout_format.is_binary_layout(path):
+                return list(layout_format.iter_items(path))
+            with open(path, "r") as f:
+                items = json.load(f)
+        # Layouts written before elements had ids get them in file order.
+        next_id = max([item["id"] for item in items if "id" in item], default=0) + 1
+        for item in items:
+            if "id" not in item:
+                item["id"] = next_id
+                next_id += 1
+        return items
+
+    @staticmethod
+    def replay_journal(items, path):
+        if not os.path.exists(path):
+            return items
+        by_id = dict((item["id"], item) for item in items)
+        created = []  # (item, id of the item above) of a run of creations
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn final record left by a crash.
+                op = record["op"]
+                if op == "create":
+                    created.append((record["element"], record.get("above")))
+                    continue
+                by_id = UIManager.place_created(by_id, created)
+                if op == "delete":
+                    for element_id in record.get("ids", (record.get("id"),)):
+                        by_id.pop(element_id, None)
+                elif op == "move" and "ids" in record:
+                    for element_id, y, x in zip(record["ids"], record["ys"], record["xs"]):
+                        item = by_id.get(element_id)
+                        if item is not None:
+                            item["y"], item["x"] = y, x
+                elif record["id"] in by_id:
+                    by_id[record["id"]].update(record["fields"])
+        return list(UIManager.place_created(by_id, created).values())
+
+    @staticmethod
+    def place_created(by_id, created):
+        # Add a run of journaled creations to by_id: on top, or under the
+        # item recorded above them. A whole run is placed in one pass, as
+        # undoing a deletion creates every element again under the next.
+        # An id already present keeps its place unless it goes under another.
+        if not created:
+            return by_id
+        ids = set(item["id"] for item, _above in created)
+        below = {}  # id or None -> ids to put just below it
+        for item, above in created:
+            if above not in by_id and above not in ids:
+                above = None
+            elif item["id"] in by_id:
+                del by_id[item["id"]]
+            below.setdefault(above, []).append(item["id"])
+        items = dict((item["id"], item) for item, _above in created)
+        del created[:]
+        if list(below) == [None]:
+            by_id.update(items)
+            return by_id
+        order = stack_below(list(by_id), below)
+        by_id.update(items)
+        return dict((element_id, by_id[element_id]) for element_id in order)
+
+    @staticmethod
+    def load_items():
+        journals = [path for path in (UIManager.JOURNAL_FILE + ".1", UIManager.JOURNAL_FILE)
+                    if os.path.exists(path) and os.path.getsize(path)]
+        if not journals:
+            return UIManager.iter_snapshot()
+        items = UIManager.load_snapshot()
+        for path in journals:
+            items = UIManager.replay_journal(items, path)
+        return items
+
+    @staticmethod
+    def convert_layout(source, target):
+        # Rewrite a layout in the format implied by the target's name.
+        UIManager.write_snapshot(UIManager.load_snapshot(source), target)
+
+    @staticmethod
+    def compact_layout(journal_path):
+        # Fold a rotated journal into the snapshot, then drop the journal.
+        items = UIManager.replay_journal(UIManager.load_snapshot(), journal_path)
+        UIManager.write_snapshot(items)
+        os.remove(journal_path)
 
     @staticmethod
-    def save_layout(elements):
-        with open(UIManager.LAYOUT_FILE, "w") as f:
-            json.dump([el.to_dict() for el in elements], f, indent=4)
+    def element_from_dict(item):
+        element = ELEMENT_TYPES.get(item["type"], UIElement).from_dict(item)
+        if "id" in item:
+            element.id = item["id"]
+            UIElement.next_id = max(UIElement.next_id, element.id + 1)
+        if item.get("constraints"):
+            check_constraints(item["constraints"])
+            element.constraints = item["constraints"]
+        return element
 
     @staticmethod
     def load_layout():
-        if os.path.exists(UIManager.LAYOUT_FILE):
-            with open(UIManager.LAYOUT_FILE, "r") as f:
-                data = json.load(f)
-                elements = []
-                for item in data:
-                    if item["type"] == "Checkbox":
-                        elements.append(Checkbox.from_dict(item))
-                    elif item["type"] == "TextInput":
-                        elements.append(TextInput.from_dict(item))
-                    elif item["type"] == "PopupButton":
-                        elements.append(PopupButton.from_dict(item))
-                    else:
-                        elements.append(UIElement.from_dict(item))
-                return elements
-        return []
\ No newline at end of file
+        return [UIManager.element_from_dict(item) for item in UIManager.load_items()]